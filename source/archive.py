@@ -0,0 +1,44 @@
+#This library contains tools to read company facts from the SEC bulk archive companyfacts.zip
+#(https://www.sec.gov/Archives/edgar/daily-index/xbrl/companyfacts.zip). Members are read
+#directly from the archive, without extracting them to disk.
+
+import json
+import logging
+import threading
+import zipfile
+import cikindex
+
+#Archives already opened by this process: {path: ZipFile}. Opening the archive parses its whole
+#central directory, so it is done only once per process
+_archives = {}
+_lock = threading.Lock()
+
+
+def member_name(cik=""):
+	"""Returns the name of the archive member with the company facts of the provided CIK (any zero padding)"""
+	return "CIK" + cikindex.normalize_cik(cik) + ".json"
+
+
+def _open(archive_path):
+	"""Returns the opened archive, opening it the first time it is requested"""
+	with _lock:
+		if archive_path not in _archives:
+			_archives[archive_path] = zipfile.ZipFile(archive_path)
+		return _archives[archive_path]
+
+
+def read_company_json(archive_path, cik=""):
+	"""Reads the company facts json of the provided CIK from the archive.
+	Returns the json or an empty one in case of errors"""
+	name = member_name(cik)
+	try:
+		archive = _open(archive_path)
+		with _lock:
+			raw = archive.read(name)
+		return json.loads(raw)
+	except KeyError:
+		logging.warning("archive.read_company_json: Member %s not found in %s", name, archive_path)
+		return {}
+	except Exception as err:
+		logging.error("archive.read_company_json: Member %s cannot be read from %s - %s", name, archive_path, err)
+		return {}
@@ -0,0 +1,332 @@
+#This script contains benchmarks for the hot paths of the training database creation.
+#They work on local files only, so they can be executed without connection to EDGAR or Yahoo.
+#Usage: python benchmark.py [companyfacts json file]
+#       python benchmark.py --html
+#       python benchmark.py --record-html AAPL [MSFT ...]
+#       python benchmark.py --pipeline [--companies 10 169 5000] [--workers 8] [--latency 0.05] [--error-rate 0.01] [--facts-file json]
+#                           [--logging off|file|queued]
+#The pipeline benchmark runs the whole training database creation against a local replay server (replayserver module)
+#with synthetic companies, in a temporary folder.
+
+import argparse
+import csv
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import pandas as pd
+import configuration as config
+import cikindex
+import dataset
+import edgar
+import htmlextract
+import instrumentation
+import manifest
+import ratelimit
+import replayserver
+import sarai
+import webclient
+
+DEFAULT_JSON_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "database", "AAPL.json")
+#EDGAR browse pages and Yahoo profile pages recorded from the real sites: <ticker>.edgar.html and <ticker>.yahoo.html
+HTML_FIXTURES_PATH = os.path.join(os.path.dirname(DEFAULT_JSON_FILE), "html_fixtures")
+
+
+def _best_time(function, repeat=3):
+	"""Returns the best wall time in seconds of repeat executions of function and its last result"""
+	best = None
+	for _ in range(repeat):
+		start = time.perf_counter()
+		result = function()
+		elapsed = time.perf_counter() - start
+		best = elapsed if best is None else min(best, elapsed)
+	return best, result
+
+
+def _legacy_concept_frames(company_json):
+	"""Previous implementation of the concept flattening: one json_normalize per financial concept (first unit only)"""
+	frames = []
+	for financial_concept in company_json['facts']['us-gaap'].keys():
+		financial_concept_unit = list(company_json['facts']['us-gaap'][financial_concept]['units'])[0]
+		financial_concept_json_array = company_json['facts']['us-gaap'][financial_concept]['units'][financial_concept_unit]
+		try:
+			financial_concept_df = pd.json_normalize(financial_concept_json_array)[['val', 'fy', 'form', 'frame']]
+		except Exception:
+			continue
+		financial_concept_df['unit'] = financial_concept_unit
+		financial_concept_df['concept'] = financial_concept
+		frames.append(financial_concept_df)
+	return frames
+
+
+def _concat_accumulation(frames):
+	"""Previous implementation of the table accumulation: one pd.concat per appended piece"""
+	table = pd.DataFrame()
+	for frame in frames:
+		table = pd.concat([table, frame])
+	return table
+
+
+def benchmark_flattener(json_file=DEFAULT_JSON_FILE):
+	"""Compares the time needed to flatten the us-gaap facts with json_normalize per concept and with the single pass flattener"""
+	with open(json_file, 'r') as f:
+		company_json = json.load(f)
+	legacy_time, legacy_table = _best_time(lambda: _concat_accumulation(_legacy_concept_frames(company_json)))
+	flattener_time, flattener_table = _best_time(lambda: edgar.create_table_from_json(company_json))
+	print(f"Flattening of {os.path.basename(json_file)}:")
+	print(f"  json_normalize per concept: {legacy_time:.3f} s ({len(legacy_table)} rows, first unit of each concept)")
+	print(f"  single pass flattener:      {flattener_time:.3f} s ({len(flattener_table)} rows, all units) ({legacy_time / flattener_time:.1f}x)")
+
+
+def _legacy_field(expression):
+	"""Returns the value of a field of the previous scraping or None if its expression fails"""
+	try:
+		return expression()
+	except Exception:
+		return None
+
+
+def _legacy_edgar_company_info(page):
+	"""Previous implementation of the EDGAR browse page scraping: full BeautifulSoup tree of the page and the expressions of
+	get_cik, get_sic and get_activity before the extraction engine, every field extracted on its own"""
+	from bs4 import BeautifulSoup
+	soup = BeautifulSoup(page, "html.parser")
+	return {
+		"cik": _legacy_field(lambda: soup.find_all("span", class_="companyName")[0].text.split("CIK#:")[1].split()[0]),
+		"sic": _legacy_field(lambda: str(soup.find("p", class_="identInfo").find_all("a")[0].next_element)),
+		"activity": _legacy_field(lambda: str(soup.find("p", class_="identInfo").find_all("a")[0].next_element.next_element).split("- ")[1].replace(",", " &")),
+	}
+
+
+def _legacy_yahoo_profile(page):
+	"""Previous implementation of the Yahoo profile page scraping: full BeautifulSoup tree of the page"""
+	from bs4 import BeautifulSoup
+	soup = BeautifulSoup(page.encode(), "html.parser")
+	return {
+		"sector": _legacy_field(lambda: str(soup.find_all("dt")[0].find_next_sibling()).split('>')[2].split('<')[0].rstrip()),
+		"industry": _legacy_field(lambda: str(soup.find_all("dt")[1].find_next_sibling()).split('>')[1].split('<')[0].rstrip().replace("amp;", "")),
+	}
+
+
+def record_html_fixtures(tickers):
+	"""Downloads the EDGAR browse page and the Yahoo profile page of the provided tickers into HTML_FIXTURES_PATH, where they are
+	used by check_html_extraction"""
+	os.makedirs(HTML_FIXTURES_PATH, exist_ok=True)
+	for ticker in tickers:
+		for kind, url, headers in [("edgar", config.BROWSE_URL.format(ticker), config.EDGAR_HEADERS), ("yahoo", config.PROFILE_URL.format(ticker), config.YAHOO_HEADERS)]:
+			response = webclient.get(url, headers=headers)
+			path = os.path.join(HTML_FIXTURES_PATH, f"{ticker}.{kind}.html")
+			with open(path, 'wb') as f:
+				f.write(response.content)
+			print(f"{url} ({response.status_code}) recorded into {path}")
+
+
+def _recorded_fixtures():
+	"""Returns the pages recorded from EDGAR and Yahoo with record_html_fixtures: [(name, kind, page)]"""
+	if not os.path.isdir(HTML_FIXTURES_PATH):
+		return []
+	fixtures = []
+	for file_name in sorted(os.listdir(HTML_FIXTURES_PATH)):
+		name, kind, extension = (file_name.rsplit(".", 2) + ["", ""])[:3]
+		if extension == "html" and kind in ("edgar", "yahoo"):
+			with open(os.path.join(HTML_FIXTURES_PATH, file_name), 'rb') as f:
+				fixtures.append((f"recorded {kind} page {name}", kind, f.read().decode("utf-8", errors="replace")))
+	return fixtures
+
+
+def _html_fixtures():
+	"""Returns the EDGAR browse pages and Yahoo profile pages used to check the extraction: [(name, kind, page)] with kind "edgar" or "yahoo".
+	The pages recorded from the real sites (see record_html_fixtures) come first, then pages generated by the replay server"""
+	fixtures = _recorded_fixtures()
+	for company in replayserver.synthetic_companies(len(replayserver.PROFILES)):
+		fixtures.append((f"browse page {company['sic']}", "edgar", replayserver.browse_page(company)))
+		fixtures.append((f"profile page {company['industry']}", "yahoo", replayserver.profile_page(company, padding=5000)))
+	company = replayserver.synthetic_companies(1)[0]
+	page = replayserver.browse_page(company)
+	fixtures += [
+		("browse page error", "edgar", replayserver.browse_error_page()),
+		("browse page several classes", "edgar", page.replace('class="companyName"', 'id="name" class="info companyName main"')),
+		("browse page without identInfo", "edgar", page.replace('class="identInfo"', 'class="other"')),
+		("browse page without SIC link", "edgar", page.replace('<a href="/cgi-bin/browse-edgar?action=getcompany&amp;SIC', '<b href="').replace(f'{company["sic"]}</a> -', f'{company["sic"]}</b> -')),
+		("browse page without CIK", "edgar", page.replace("CIK</acronym>#:", "CIK</acronym>")),
+		("browse page without activity", "edgar", page.replace(f'{company["sic"]}</a> - {company["activity"]}', f'{company["sic"]}</a>')),
+		("browse page with activity without dash", "edgar", page.replace(f'{company["sic"]}</a> - ', f'{company["sic"]}</a> ')),
+		("browse page with markup in SIC link", "edgar", page.replace(f'{company["sic"]}</a>', f'{company["sic"]}<b></b></a>')),
+	]
+	page = replayserver.profile_page(company, padding=5000)
+	fixtures += [
+		("profile page error", "yahoo", replayserver.profile_error_page(company["ticker"])),
+		("profile page with dt in scripts", "yahoo", page.replace('<script type="application/json">', '<script type="application/json">{"html":"<dt>Fake</dt><dd><a>Wrong</a></dd>"}', 1)),
+		("profile page with one dt", "yahoo", page.replace("<dt>Industry: </dt>", "<span>Industry: </span>").replace("<dt>Full Time Employees: </dt>", "<span></span>")),
+		("profile page with last dt", "yahoo", page.replace('<dd><a href="/sectors/technology/">Technology</a></dd>', "")),
+		("profile page with entities", "yahoo", page.replace("Consumer Electronics", "Furnishings, Fixtures &amp; Appliances")),
+	]
+	return fixtures
+
+
+def check_html_extraction():
+	"""Checks that the extraction engine (htmlextract module) returns the same fields as the previous BeautifulSoup scraping
+	for all the fixture pages. Returns the number of pages checked. Raises AssertionError on the first difference"""
+	fixtures = _html_fixtures()
+	recorded = len(_recorded_fixtures())
+	if not recorded:
+		print(f"HTML extraction: no recorded pages in {HTML_FIXTURES_PATH}, record them with: benchmark.py --record-html AAPL")
+	for name, kind, page in fixtures:
+		if kind == "edgar":
+			expected, extracted = _legacy_edgar_company_info(page), htmlextract.edgar_company_info(page)
+		else:
+			expected, extracted = _legacy_yahoo_profile(page), htmlextract.yahoo_profile(page)
+		assert extracted == expected, f"{name}: extracted {extracted}, expected {expected}"
+	print(f"HTML extraction: {len(fixtures)} fixture pages ({recorded} recorded) extract the same fields as BeautifulSoup")
+	return len(fixtures)
+
+
+def benchmark_html_extraction(repeat=20):
+	"""Compares the CPU time needed to extract the company fields from an EDGAR browse page and a Yahoo profile page
+	with the previous BeautifulSoup scraping and with the extraction engine"""
+	company = replayserver.synthetic_companies(1)[0]
+	for kind, page, legacy, engine in [
+			("EDGAR browse page", replayserver.browse_page(company), _legacy_edgar_company_info, htmlextract.edgar_company_info),
+			("Yahoo profile page", replayserver.profile_page(company), _legacy_yahoo_profile, htmlextract.yahoo_profile)]:
+		legacy_time, _ = _best_time(lambda: [legacy(page) for _ in range(repeat)])
+		engine_time, _ = _best_time(lambda: [engine(page) for _ in range(repeat)])
+		print(f"Extraction from {kind} ({len(page) / 1000:.0f} KB):")
+		print(f"  BeautifulSoup html.parser: {legacy_time * 1000 / repeat:.3f} ms/page")
+		print(f"  extraction engine:         {engine_time * 1000 / repeat:.3f} ms/page ({legacy_time / engine_time:.0f}x)")
+
+
+#Configuration settings replaced by the pipeline benchmark and restored when it finishes
+PIPELINE_SETTINGS = ['DATABASE_PATH', 'LOG_PATH', 'CACHE_PATH', 'EDGAR_INDEX_FILE_PATH', 'COMPANY_TICKERS_FILE',
+	'EDGAR_TRAINING_FILE', 'EDGAR_TRAINING_DATASET_PATH', 'COMPANYFACTS_ARCHIVE', 'EDGAR_QUERY_INDEX_PATH', 'EDGAR_FEATURES_PATH',
+	'EDGAR_MANIFEST_FILE', 'RAW_STORE_PATH', 'EDGAR_METADATA_CACHE_FILE', 'YAHOO_PROFILE_CACHE_FILE', 'companyFactsURL', 'BROWSE_URL', 'PROFILE_URL']
+
+
+def _redirect_paths(folder):
+	"""Points all the files and folders of the configuration to folder"""
+	folder = os.path.join(folder, "")
+	config.DATABASE_PATH = folder
+	config.LOG_PATH = os.path.join(folder, "log", "")
+	config.CACHE_PATH = os.path.join(folder, "cache", "")
+	config.EDGAR_INDEX_FILE_PATH = folder + "00_INDEX_USA.csv"
+	config.COMPANY_TICKERS_FILE = folder + "company_tickers.json"
+	config.EDGAR_TRAINING_FILE = folder + "01_EDGAR_TRAINING_TABLE.csv"
+	config.EDGAR_TRAINING_DATASET_PATH = os.path.join(folder, "01_EDGAR_TRAINING_DATASET", "")
+	config.COMPANYFACTS_ARCHIVE = folder + "companyfacts.zip"
+	config.EDGAR_QUERY_INDEX_PATH = os.path.join(folder, "01_EDGAR_QUERY_INDEX", "")
+	config.EDGAR_FEATURES_PATH = os.path.join(folder, "01_EDGAR_FEATURES", "")
+	config.EDGAR_MANIFEST_FILE = folder + "01_EDGAR_MANIFEST.json"
+	config.RAW_STORE_PATH = os.path.join(folder, "raw", "")
+	config.EDGAR_METADATA_CACHE_FILE = config.CACHE_PATH + "edgar_metadata.json"
+	config.YAHOO_PROFILE_CACHE_FILE = config.CACHE_PATH + "yahoo_profiles.json"
+
+
+def _write_index(companies):
+	"""Writes the INDEX file with the tickers and CIKs of the provided companies"""
+	with open(config.EDGAR_INDEX_FILE_PATH, 'w', newline='') as f:
+		writer = csv.writer(f)
+		writer.writerow(["TICKER", "CIK"])
+		writer.writerows([company["ticker"], company["cik"]] for company in companies)
+
+
+def _reload_state():
+	"""Discards the in-memory state loaded from the previous files (CIK index, manifest and dataset dimension table)"""
+	cikindex.reload()
+	manifest.reload()
+	dataset.reload()
+
+
+def _print_run(title, elapsed, companies, run_report):
+	"""Prints the throughput, stages and requests of a pipeline run from its instrumentation report"""
+	rows = run_report["counters"].get("rows.exported", 0)
+	peak = run_report["peak_memory_mb"]
+	print(f"  {title}: {elapsed:.2f} s, {companies} companies ({companies / elapsed:.1f}/s), {rows} rows ({rows / elapsed:.0f}/s)"
+		+ (f", peak memory {peak:.0f} MB" if peak is not None else ""))
+	for name, stage in sorted(run_report["stages"].items(), key=lambda item: -item[1]["seconds"]):
+		print(f"    {name:40s} {stage['calls']:6d} calls {stage['seconds']:9.2f} s ({stage['seconds'] * 1000 / stage['calls']:8.2f} ms/call, max {stage['max_seconds'] * 1000:8.1f} ms)")
+	for host, measure in run_report["hosts"].items():
+		print(f"    requests to {host}: {measure['requests']}, {measure['bytes'] / 1e6:.1f} MB, mean {measure['mean_ms']:.1f} ms, max {measure['max_ms']:.1f} ms, status {measure['status']}")
+	counters = {name: value for name, value in run_report["counters"].items() if name.startswith(("cache.", "companies."))}
+	print(f"    counters: {counters}")
+
+
+def benchmark_pipeline(companies=10, workers=config.TRAINING_WORKERS, rate_limits=False, keep=False, **server_options):
+	"""Measures the end to end and per stage throughput of the training database creation for a number of synthetic companies,
+	served by a local replay server with the provided options (latency, jitter, error_rate, facts_file, concepts...).
+	Two runs are measured: a cold build with empty caches and an incremental build where nothing has changed.
+	Unless rate_limits is True the EDGAR and Yahoo rate limiters are disabled, so the pipeline itself is measured.
+	All the files are created in a temporary folder, which is removed at the end unless keep is True"""
+	folder = tempfile.mkdtemp(prefix="sarai_benchmark_")
+	settings = {name: getattr(config, name) for name in PIPELINE_SETTINGS}
+	limiters = ratelimit.EDGAR, ratelimit.YAHOO
+	synthetic = replayserver.synthetic_companies(companies)
+	print(f"Pipeline with {companies} synthetic companies, {workers} workers, options {server_options}, rate limits {'on' if rate_limits else 'off'}:")
+	try:
+		with replayserver.ReplayServer(synthetic, **server_options) as server:
+			server.configure()
+			_redirect_paths(folder)
+			_write_index(synthetic)
+			_reload_state()
+			if not rate_limits:
+				ratelimit.EDGAR = ratelimit.YAHOO = ratelimit.TokenBucket(1e9)
+			for title, incremental in [("cold build", False), ("incremental build", True)]:
+				start = time.perf_counter()
+				built = edgar.create_training_database(workers=workers, incremental=incremental)
+				elapsed = time.perf_counter() - start
+				_print_run(title, elapsed, built, instrumentation.report())
+	finally:
+		for name, value in settings.items():
+			setattr(config, name, value)
+		ratelimit.EDGAR, ratelimit.YAHOO = limiters
+		_reload_state()
+		if keep:
+			print(f"  files kept in {folder}")
+		else:
+			shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Benchmarks of the training database creation")
+	parser.add_argument("json_file", nargs="?", default=DEFAULT_JSON_FILE, help="companyfacts json file for the flattening benchmarks")
+	parser.add_argument("--pipeline", action="store_true", help="run the end to end benchmark against the local replay server")
+	parser.add_argument("--html", action="store_true", help="check and benchmark the extraction of the EDGAR and Yahoo pages")
+	parser.add_argument("--record-html", nargs="+", metavar="TICKER", help="record the EDGAR and Yahoo pages of the tickers for the --html check")
+	parser.add_argument("--companies", type=int, nargs="+", default=[10, 169, 5000], help="number of synthetic companies of every run")
+	parser.add_argument("--workers", type=int, default=config.TRAINING_WORKERS)
+	parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+	parser.add_argument("--jitter", type=float, default=0.0, help="random seconds (uniform) added to every response")
+	parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+	parser.add_argument("--facts-file", help="recorded companyfacts json served for every company (synthetic facts if not provided)")
+	parser.add_argument("--concepts", type=int, default=100, help="concepts of the synthetic facts")
+	parser.add_argument("--facts-per-concept", type=int, default=20, help="facts per concept of the synthetic facts")
+	parser.add_argument("--rate-limits", action="store_true", help="keep the EDGAR and Yahoo rate limiters")
+	parser.add_argument("--keep", action="store_true", help="keep the temporary files")
+	parser.add_argument("--logging", choices=["off", "file", "queued"], default="off",
+		help="pipeline log: errors to the console only, INFO written to a file as it is logged or INFO queued and sampled (sarai module)")
+	args = parser.parse_args()
+	if args.pipeline:
+		log_file = os.path.join(tempfile.gettempdir(), "sarai_benchmark.log")
+		listener = None
+		if args.logging == "off":
+			logging.basicConfig(level=logging.ERROR)
+		elif args.logging == "file":
+			logging.basicConfig(filename=log_file, format=sarai.LOG_FORMAT, datefmt=sarai.LOG_DATE_FORMAT, level=logging.INFO)
+		else:
+			listener = sarai.setup_logging(logging.INFO, log_file)
+		try:
+			for companies in args.companies:
+				benchmark_pipeline(companies, args.workers, args.rate_limits, args.keep, latency=args.latency, jitter=args.jitter,
+					error_rate=args.error_rate, facts_file=args.facts_file, concepts=args.concepts, facts_per_concept=args.facts_per_concept)
+		finally:
+			if listener is not None:
+				listener.stop()
+		if args.logging != "off":
+			print(f"Log written into {log_file} ({os.path.getsize(log_file) / 1e6:.1f} MB)")
+	elif args.record_html:
+		record_html_fixtures(args.record_html)
+	elif args.html:
+		check_html_extraction()
+		benchmark_html_extraction()
+	else:
+		benchmark_flattener(args.json_file)
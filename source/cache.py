@@ -0,0 +1,63 @@
+#This library contains a small persistent key/value cache stored as json files.
+#It is used to avoid downloading again data that rarely changes (company metadata and profiles).
+
+import itertools
+import logging
+import os
+import threading
+import time
+import instrumentation
+import jsonstore
+
+#Cache files already loaded: {path: store with {key: {"time": timestamp, "value": value}}}
+_caches = {}
+_lock = threading.Lock()
+
+
+def _store(path):
+	"""Returns the store of the cache file path, creating it the first time"""
+	with _lock:
+		if path not in _caches:
+			_caches[path] = jsonstore.JsonStore(path)
+		return _caches[path]
+
+
+def get(path, key, ttl):
+	"""Returns the value cached for key in the cache file path if it is younger than ttl seconds.
+	Returns None if the key is not cached or has expired"""
+	store = _store(path)
+	with store.lock:
+		entry = store.data().get(key)
+	if entry is None or time.time() - entry["time"] > ttl:
+		logging.info("cache.get: Cache miss for %s in %s", key, path)
+		instrumentation.count("cache." + os.path.splitext(os.path.basename(path))[0] + ".miss")
+		return None
+	logging.info("cache.get: Cache hit for %s in %s", key, path)
+	instrumentation.count("cache." + os.path.splitext(os.path.basename(path))[0] + ".hit")
+	return entry["value"]
+
+
+def put(path, key, value, max_entries=None):
+	"""Stores value for key in the cache file path.
+	If max_entries is provided, the oldest entries are evicted to keep the cache within that size.
+	The cache file is written in batches (see flush)"""
+	store = _store(path)
+	with store.lock:
+		entries = store.data()
+		#Entries are kept in the order they are stored, so the oldest ones are the first ones
+		entries.pop(key, None)
+		entries[key] = {"time": time.time(), "value": value}
+		if max_entries and len(entries) > max_entries:
+			oldest = list(itertools.islice(entries, len(entries) - max_entries))
+			logging.info("cache.put: Evicting %s entries from %s", len(oldest), path)
+			for old_key in oldest:
+				del entries[old_key]
+	store.changed()
+
+
+def flush():
+	"""Writes the entries not written yet of all the cache files"""
+	with _lock:
+		stores = list(_caches.values())
+	for store in stores:
+		store.flush()
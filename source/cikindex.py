@@ -0,0 +1,76 @@
+#This library contains the local ticker to CIK index. It is built from the INDEX file and an optional
+#local snapshot of the SEC company_tickers.json file (https://www.sec.gov/files/company_tickers.json),
+#so CIKs are resolved in memory without connecting to EDGAR.
+
+import csv
+import json
+import logging
+import os
+import threading
+import configuration as config
+
+#Index loaded in memory: {ticker: 10 digits CIK}
+_index = None
+_lock = threading.Lock()
+
+
+def normalize_cik(cik=""):
+	"""Returns the provided CIK as a 10 digits string (EDGAR format) or an empty string if it is not a valid CIK"""
+	cik = str(cik).strip()
+	if not cik.isdigit() or int(cik) == 0 or len(cik.lstrip("0")) > 10:
+		return ""
+	return cik.lstrip("0").zfill(10)
+
+
+def _normalize_ticker(ticker=""):
+	"""Returns the key used for the provided ticker in the index"""
+	return str(ticker).strip().upper()
+
+
+def _load():
+	"""Returns the in-memory index, building it the first time from the company tickers snapshot and the INDEX file"""
+	global _index
+	if _index is None:
+		index = {}
+		if os.path.isfile(config.COMPANY_TICKERS_FILE):
+			try:
+				with open(config.COMPANY_TICKERS_FILE, 'r') as f:
+					for company in json.load(f).values():
+						cik = normalize_cik(company.get("cik_str", ""))
+						if cik:
+							index[_normalize_ticker(company.get("ticker", ""))] = cik
+			except Exception as err:
+				logging.warning("cikindex._load: Company tickers file %s cannot be read - %s", config.COMPANY_TICKERS_FILE, err)
+		if os.path.isfile(config.EDGAR_INDEX_FILE_PATH):
+			try:
+				with open(config.EDGAR_INDEX_FILE_PATH, 'r', newline='') as f:
+					for row in csv.DictReader(f):
+						cik = normalize_cik(row.get("CIK", ""))
+						if cik:
+							index[_normalize_ticker(row.get("TICKER", ""))] = cik
+			except Exception as err:
+				logging.warning("cikindex._load: INDEX file %s cannot be read - %s", config.EDGAR_INDEX_FILE_PATH, err)
+		logging.info("cikindex._load: CIK index loaded with %s tickers", len(index))
+		_index = index
+	return _index
+
+
+def resolve_cik(ticker=""):
+	"""Returns the 10 digits CIK of the provided ticker from the local index or None if the ticker is not indexed"""
+	with _lock:
+		return _load().get(_normalize_ticker(ticker))
+
+
+def add_cik(ticker="", cik=""):
+	"""Adds to the in-memory index the CIK of a ticker resolved by other means"""
+	cik = normalize_cik(cik)
+	if cik:
+		with _lock:
+			_load()[_normalize_ticker(ticker)] = cik
+
+
+def reload():
+	"""Discards the in-memory index, so it is built again on the next resolution"""
+	global _index
+	with _lock:
+		_index = None
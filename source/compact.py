@@ -0,0 +1,53 @@
+#This library contains the compact representation of the training table. Text columns are stored as
+#dictionary encoded categoricals (small integer codes), numeric columns use fixed width types and the
+#company attributes, which are the same for all the rows of a company, are moved to a dimension table
+#joined by ticker.
+
+import pandas as pd
+import facts
+
+#Company attributes moved to the dimension table
+COMPANY_COLUMNS = ['sector', 'industry', 'activity', 'sic']
+#Text columns of the facts table stored as categoricals
+CATEGORICAL_COLUMNS = ['form', 'frame', 'unit', 'concept', 'accn', 'ticker']
+#Column order of the training table
+TABLE_COLUMNS = facts.FACT_COLUMNS + ['ticker'] + COMPANY_COLUMNS
+
+
+def compact_table(table):
+	"""Splits a training table into its compact representation.
+	Returns (facts table with categorical text columns, val as float64 and fy as Int16, companies dimension table indexed by ticker)"""
+	companies = table[['ticker'] + [column for column in COMPANY_COLUMNS if column in table.columns]].drop_duplicates('ticker').set_index('ticker').astype(object)
+	compact = table.drop(columns=[column for column in COMPANY_COLUMNS if column in table.columns])
+	for column in CATEGORICAL_COLUMNS:
+		if column in compact.columns:
+			compact[column] = compact[column].astype('category')
+	compact['val'] = compact['val'].astype('float64')
+	compact['fy'] = compact['fy'].astype('Int16')
+	return compact.reset_index(drop=True), companies
+
+
+def concat_compact(tables):
+	"""Concatenates compact facts tables, merging the categories of every categorical column so the result stays compact.
+	Returns the concatenated table"""
+	if not tables:
+		return pd.DataFrame()
+	columns = {}
+	for column in tables[0].columns:
+		if isinstance(tables[0][column].dtype, pd.CategoricalDtype):
+			columns[column] = pd.api.types.union_categoricals([table[column] for table in tables])
+		else:
+			columns[column] = pd.concat([table[column] for table in tables], ignore_index=True)
+	return pd.DataFrame(columns)
+
+
+def expand_table(compact, companies):
+	"""Rebuilds the training table layout (text columns as strings and company attributes in every row) from the compact representation.
+	Returns the table as a pandas dataframe"""
+	table = compact.copy()
+	for column in CATEGORICAL_COLUMNS:
+		if column in table.columns and isinstance(table[column].dtype, pd.CategoricalDtype):
+			table[column] = table[column].astype(table[column].cat.categories.dtype)
+	table['fy'] = table['fy'].astype('Int32')
+	table = table.join(companies, on='ticker')
+	return table[[column for column in TABLE_COLUMNS if column in table.columns]]
@@ -8,6 +8,39 @@ from datetime import datetime
 DATABASE_PATH = os.path.dirname(os.path.dirname(__file__)) + "\\database\\"
 BACKUP_PATH = DATABASE_PATH + "\\backup\\"
 LOG_PATH = os.path.dirname(os.path.dirname(__file__)) + "\\log\\"
+CACHE_PATH = DATABASE_PATH + "cache\\"
+
+#The json files updated during a build (manifest, caches, dataset dimension table) are written every JSON_STORE_FLUSH_EVERY
+#changes or JSON_STORE_FLUSH_SECONDS seconds and at the end of the run, instead of on every change
+JSON_STORE_FLUSH_EVERY = 500
+JSON_STORE_FLUSH_SECONDS = 30
+
+############## LOGGING CONFIGURATION ##########
+
+#Repeated INFO messages (same message template, e.g. one per company or per concept) are sampled in the log: the first
+#LOG_SAMPLING_FIRST of every template are written and then one of every LOG_SAMPLING_RATE. Warnings and errors are always written
+LOG_SAMPLING_FIRST = 20
+LOG_SAMPLING_RATE = 100
+
+############## HTTP CONFIGURATION ##########
+
+#Timeouts in seconds to connect and to receive data
+HTTP_CONNECT_TIMEOUT = 10
+HTTP_READ_TIMEOUT = 60
+
+#Retries of requests failed with connection errors or with these status codes, waiting HTTP_BACKOFF_FACTOR * 2^attempt seconds
+#(or the Retry-After requested by the server, up to HTTP_MAX_RETRY_WAIT seconds)
+HTTP_RETRY_STATUS = [429, 500, 502, 503, 504]
+HTTP_MAX_RETRIES = 4
+HTTP_BACKOFF_FACTOR = 1
+HTTP_MAX_RETRY_WAIT = 120
+
+#Size in bytes of the chunks in which large responses are received and written to disk
+HTTP_CHUNK_SIZE = 1024 * 1024
+
+#Connection pools: number of hosts and connections kept alive per host
+HTTP_POOL_HOSTS = 4
+HTTP_POOL_MAXSIZE = 16
 
 ############## EDGAR CONFIGURATION ##########
 
@@ -30,11 +63,58 @@ ERROR_MESSAGE2 = "The value you submitted is not valid"
 #File with a list of companies to be included in the EDGAR training database
 EDGAR_INDEX_FILE_PATH = DATABASE_PATH + "00_INDEX_USA.csv"
 
+#Optional local snapshot of the SEC ticker to CIK file (https://www.sec.gov/files/company_tickers.json), used with the INDEX
+#file to resolve CIKs without connecting to EDGAR
+COMPANY_TICKERS_FILE = DATABASE_PATH + "company_tickers.json"
+
 #Path to the EDGAR training csv file
 EDGAR_TRAINING_FILE = DATABASE_PATH + "01_EDGAR_TRAINING_TABLE.csv"
 
+#Folder with the training table partitioned by ticker (one file per company)
+EDGAR_TRAINING_DATASET_PATH = DATABASE_PATH + "01_EDGAR_TRAINING_DATASET\\"
+
+#Local copy of the SEC bulk archive with the company facts of all the companies, used for offline builds
+#(https://www.sec.gov/Archives/edgar/daily-index/xbrl/companyfacts.zip)
+COMPANYFACTS_ARCHIVE = DATABASE_PATH + "companyfacts.zip"
+
+#Folder with the query index of the training dataset (memory mapped columns sorted by ticker, concept and fiscal year)
+EDGAR_QUERY_INDEX_PATH = DATABASE_PATH + "01_EDGAR_QUERY_INDEX\\"
+
+#Folder with the cached feature rows (fiscal years x concepts) of every company of the training dataset
+EDGAR_FEATURES_PATH = DATABASE_PATH + "01_EDGAR_FEATURES\\"
+
+#Feature matrix written by the features command (without extension, it is stored in the format of the partitions)
+EDGAR_FEATURES_MATRIX_FILE = DATABASE_PATH + "01_EDGAR_FEATURES_MATRIX"
+
+#Store the training dataset in compact layout: categorical text columns and company attributes in a dimension table
+COMPACT_TRAINING_DATASET = True
+
+#Manifest with the download validators, content hash and build time of every company of the training database
+EDGAR_MANIFEST_FILE = DATABASE_PATH + "01_EDGAR_MANIFEST.json"
+
+#Content addressed store with all the versions of the downloaded company facts and of the training table, compressed and deduplicated
+RAW_STORE_PATH = DATABASE_PATH + "raw\\"
+
+#Cache with the company metadata (CIK, SIC, activity) scraped from the EDGAR browse page and its time to live in seconds
+EDGAR_METADATA_CACHE_FILE = CACHE_PATH + "edgar_metadata.json"
+EDGAR_METADATA_CACHE_TTL = 30 * 24 * 3600
+
+#Maximum number of requests per second sent to EDGAR (SEC fair access policy allows up to 10). Requests are evenly spaced, without bursts
+EDGAR_MAX_REQUESTS_PER_SECOND = 10
+
+#Number of companies processed in parallel when creating the training database (1 = serial)
+TRAINING_WORKERS = 8
+
 ############## YAHOO CONFIGURATION ##########
 
 PROFILE_URL = "https://finance.yahoo.com/quote/{}/profile/"
 YAHOO_HEADERS = {'User-agent' : 'Mozilla/5.0'}
 ERROR_MESSAGE3 = "No results for"
+
+#Cache with the company profiles (sector, industry) scraped from Yahoo, its time to live in seconds and its maximum size
+YAHOO_PROFILE_CACHE_FILE = CACHE_PATH + "yahoo_profiles.json"
+YAHOO_PROFILE_CACHE_TTL = 90 * 24 * 3600
+YAHOO_PROFILE_CACHE_MAX_ENTRIES = 20000
+
+#Maximum number of requests per second sent to Yahoo
+YAHOO_MAX_REQUESTS_PER_SECOND = 2
@@ -0,0 +1,182 @@
+#This library contains tools to store the training table as a dataset partitioned by ticker.
+#Every company is written to its own partition as soon as it is created, so a failure does not
+#lose the companies already processed and the memory needed does not grow with the INDEX size.
+
+import json
+import logging
+import os
+import pandas as pd
+import configuration as config
+import compact
+import instrumentation
+import jsonstore
+
+#Parquet is used when a parquet engine is installed, otherwise partitions are stored as csv files
+try:
+	import pyarrow
+	PARTITION_FORMAT = "parquet"
+except ImportError:
+	PARTITION_FORMAT = "csv"
+
+#File with the ordered list of partitions of the last completed build
+DATASET_INDEX_FILE = "_partitions.json"
+#Dimension table with the company attributes, used by the compact partitions
+DATASET_COMPANIES_FILE = "_companies.json"
+
+#Dimension table: {ticker: {attribute: value}}. It is written in batches and with the dataset index, not on every partition
+_companies = jsonstore.JsonStore(lambda: config.EDGAR_TRAINING_DATASET_PATH + DATASET_COMPANIES_FILE)
+
+
+def partition_path(ticker=""):
+	"""Returns the path of the partition file of the provided ticker"""
+	return config.EDGAR_TRAINING_DATASET_PATH + ticker + "." + PARTITION_FORMAT
+
+
+def partition_exists(ticker=""):
+	"""Checks if the partition of the provided ticker has been written"""
+	return os.path.isfile(partition_path(ticker))
+
+
+def _update_companies(companies):
+	"""Stores the attributes of the provided companies (dimension table indexed by ticker) into the dimension table"""
+	with _companies.lock:
+		_companies.data().update(companies.to_dict(orient='index'))
+	_companies.changed()
+
+
+def flush():
+	"""Writes the dimension table changes not written yet"""
+	_companies.flush()
+
+
+def reload():
+	"""Writes the pending changes and discards the in-memory dimension table, so it is read again from the dataset folder on the next access"""
+	_companies.reload()
+
+
+def read_companies(tickers=None):
+	"""Returns the dimension table with the attributes of all the companies (or of the provided tickers) indexed by ticker"""
+	with _companies.lock:
+		companies = dict(_companies.data())
+	if tickers is not None:
+		companies = {ticker: companies[ticker] for ticker in tickers if ticker in companies}
+	return pd.DataFrame.from_dict(companies, orient='index', columns=compact.COMPANY_COLUMNS).rename_axis('ticker')
+
+
+@instrumentation.timed("dataset.write_partition")
+def write_partition(ticker, company_table):
+	"""Stores the table of a company into its partition, replacing the previous one.
+	In compact mode (config.COMPACT_TRAINING_DATASET) the company attributes are stored in the dimension table and the
+	partition keeps only the facts with categorical text columns.
+	The file is written under a temporary name and then renamed, so an interrupted write never leaves a broken partition.
+	Returns True if the partition has been written"""
+	path = partition_path(ticker)
+	tmp_path = path + ".tmp"
+	try:
+		os.makedirs(config.EDGAR_TRAINING_DATASET_PATH, exist_ok=True)
+		if config.COMPACT_TRAINING_DATASET:
+			company_table, companies = compact.compact_table(company_table)
+			_update_companies(companies)
+		if PARTITION_FORMAT == "parquet":
+			company_table.to_parquet(tmp_path, index=False)
+		else:
+			company_table.to_csv(tmp_path, index=False)
+		os.replace(tmp_path, path)
+	except Exception as err:
+		logging.error("dataset.write_partition: Partition for ticker %s cannot be written into %s - %s", ticker, path, err)
+		return False
+	else:
+		logging.info("dataset.write_partition: Partition for ticker %s with %s rows written into %s", ticker, len(company_table), path)
+		instrumentation.count("rows.written", len(company_table))
+		return True
+
+
+def read_partition(ticker="", compact_layout=False):
+	"""Reads the table of a company from its partition.
+	Compact partitions are expanded to the training table layout unless compact_layout is True.
+	Returns the table as a pandas dataframe or an empty dataframe in case of error"""
+	path = partition_path(ticker)
+	try:
+		if PARTITION_FORMAT == "parquet":
+			company_table = pd.read_parquet(path)
+		else:
+			company_table = pd.read_csv(path, parse_dates=['end', 'filed'])
+			company_table['fy'] = company_table['fy'].astype("Int32")
+		if compact_layout:
+			return compact.compact_table(company_table)[0]
+		if 'sector' not in company_table.columns:
+			company_table = compact.expand_table(company_table, read_companies([ticker]))
+		return company_table
+	except Exception as err:
+		logging.error("dataset.read_partition: Partition for ticker %s cannot be read from %s - %s", ticker, path, err)
+		return pd.DataFrame()
+
+
+def write_dataset_index(tickers):
+	"""Stores the ordered list of tickers that form the dataset, together with the dimension table of their attributes"""
+	path = config.EDGAR_TRAINING_DATASET_PATH + DATASET_INDEX_FILE
+	os.makedirs(config.EDGAR_TRAINING_DATASET_PATH, exist_ok=True)
+	flush()
+	with open(path + ".tmp", 'w') as f:
+		json.dump(list(tickers), f)
+	os.replace(path + ".tmp", path)
+	logging.info("dataset.write_dataset_index: Dataset index with %s tickers written into %s", len(tickers), path)
+
+
+def dataset_stamp():
+	"""Returns a string that changes every time the dataset index is written (every completed build) or None if there is no
+	dataset index"""
+	path = config.EDGAR_TRAINING_DATASET_PATH + DATASET_INDEX_FILE
+	if not os.path.isfile(path):
+		return None
+	status = os.stat(path)
+	return f"{status.st_mtime_ns}-{status.st_size}"
+
+
+def read_dataset_index():
+	"""Returns the ordered list of tickers that form the dataset.
+	If the dataset index does not exist, all the partitions found are returned in alphabetical order"""
+	path = config.EDGAR_TRAINING_DATASET_PATH + DATASET_INDEX_FILE
+	if os.path.isfile(path):
+		with open(path, 'r') as f:
+			return json.load(f)
+	if not os.path.isdir(config.EDGAR_TRAINING_DATASET_PATH):
+		return []
+	suffix = "." + PARTITION_FORMAT
+	return sorted(name[:-len(suffix)] for name in os.listdir(config.EDGAR_TRAINING_DATASET_PATH) if name.endswith(suffix))
+
+
+def iter_partitions(tickers=None, compact_layout=False):
+	"""Yields (ticker, table) for every partition of the dataset, one at a time and in dataset order"""
+	for ticker in (read_dataset_index() if tickers is None else tickers):
+		company_table = read_partition(ticker, compact_layout)
+		if not company_table.empty:
+			yield ticker, company_table
+
+
+def read_training_dataset(tickers=None, compact_layout=False):
+	"""Reads the whole training dataset (or only the provided tickers) into a single table.
+	Returns the table as a pandas dataframe, with the same rows and order as the training csv file.
+	If compact_layout is True, returns (facts table with categorical columns, companies dimension table) instead"""
+	company_tables = [company_table for ticker, company_table in iter_partitions(tickers, compact_layout)]
+	if compact_layout:
+		return compact.concat_compact(company_tables), read_companies(tickers)
+	if not company_tables:
+		return pd.DataFrame()
+	return pd.concat(company_tables, ignore_index=True)
+
+
+def export_csv(out_filename):
+	"""Writes the training dataset into a single csv file, streaming one partition at a time.
+	Returns the number of rows written"""
+	rows = 0
+	tmp_filename = out_filename + ".tmp"
+	with open(tmp_filename, 'w', newline='') as f:
+		for ticker, company_table in iter_partitions():
+			company_table.index = pd.RangeIndex(rows, rows + len(company_table))
+			company_table.to_csv(f, header=(rows == 0))
+			rows += len(company_table)
+	os.replace(tmp_filename, out_filename)
+	logging.info("dataset.export_csv: %s rows exported into %s", rows, out_filename)
+	instrumentation.count("rows.exported", rows)
+	return rows
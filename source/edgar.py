@@ -1,278 +1,477 @@
 #This library contains tools to get data from edgar website and handle different
 #edgar related data structures.
 
-from requests import get
-from bs4 import BeautifulSoup
 import pandas as pd
 import json
+import hashlib
 import time
 import logging
-import datetime
 import os
-import shutil
+import itertools
 import configuration as config
+import cache
+import ratelimit
+import webclient
 import yahoo
+import facts
+import dataset
+import manifest
+import archive
+import cikindex
+import rawstore
+import htmlextract
+import instrumentation
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 
+#Name of the training table versions in the raw store
+TRAINING_TABLE_NAME = "01_EDGAR_TRAINING_TABLE"
 
-def create_training_database():
+
+def create_training_database(workers=config.TRAINING_WORKERS, incremental=False, resume=True, archive_path=None):
 	"""Creates a csv file containing the financial concepts extracted from EDGAR database for all the companies defined in the INDEX file.
+	Companies are processed by a pool of worker threads (1 = serial), requests are limited by the global EDGAR and Yahoo rate limiters
+	and the rows keep the order of the INDEX file.
+	Every company is stored into its own partition of the training dataset as soon as it is created and the csv file is exported
+	from the dataset at the end, so the whole table is never held in memory.
+	In incremental mode the company facts are requested with conditional GETs and the partitions of unchanged companies are reused.
+	If resume is True and the previous build was interrupted, the companies already built by it are not processed again.
+	If archive_path is provided, the company facts are read from that local copy of the SEC companyfacts.zip archive and flattened
+	by a pool of worker processes, without connecting to EDGAR or Yahoo (company information is taken from the caches).
+	The wall time of every stage, the requests, cache hits and rows of the run are written into a performance report in the log folder.
 	Returns the number of companies added to the table
 	The csv table will be used afterwards for training"""
+	instrumentation.reset()
+	with instrumentation.stage("edgar.create_training_database"):
+		try:
+			companies = _create_training_database(workers, incremental, resume, archive_path)
+		finally:
+			#The manifest, the caches and the dimension table are written in batches during the run: the last updates are written even if the run fails
+			dataset.flush()
+			manifest.flush()
+			cache.flush()
+	instrumentation.count("companies.in_table", companies)
+	instrumentation.write_report()
+	return companies
+
+
+def _create_training_database(workers, incremental, resume, archive_path):
+	"""Runs the steps of create_training_database. Returns the number of companies added to the table"""
 	if  not os.path.isfile(config.EDGAR_INDEX_FILE_PATH):
-		logging.error(f"edgar.create_training_database: INDEX file does not exist in the expected location: {config.EDGAR_INDEX_FILE_PATH}")
+		logging.error("edgar.create_training_database: INDEX file does not exist in the expected location: %s", config.EDGAR_INDEX_FILE_PATH)
 		return 0
-	logging.info(f"edgar.create_training_database: Reading list of companies from INDEX file {config.EDGAR_INDEX_FILE_PATH}")
+	logging.info("edgar.create_training_database: Reading list of companies from INDEX file %s", config.EDGAR_INDEX_FILE_PATH)
 	try:
-		companies_list = pd.read_csv(config.EDGAR_INDEX_FILE_PATH).iloc[:, 0]
+		companies_list = pd.read_csv(config.EDGAR_INDEX_FILE_PATH, dtype=str).iloc[:, 0]
 	except Exception as err:
-		logging.error(f"edgar.create_training_database: INDEX file is not well formatted - {err}")
+		logging.error("edgar.create_training_database: INDEX file is not well formatted - %s", err)
 		return 0
 	else:
-		logging.info(f"edgar.create_training_database: List of companies obtained from INDEX file")
-	companies_table = pd.DataFrame()
-	companies_in_table = 0
-	for company in companies_list:
-		logging.info(f"edgar.create_training_database: Creating dataframe for company {company}")
-		company_df = create_table_for_company(company)
-		if company_df.empty:
-			logging.warning(f"edgar.create_training_database: Dataframe for company {company} cannot be created")
+		logging.info("edgar.create_training_database: List of companies obtained from INDEX file")
+	run_started = manifest.start_run(resume)
+	companies_in_table = []
+	workers = max(1, int(workers))
+	logging.info("edgar.create_training_database: Creating company partitions with %s workers (incremental: %s, resume: %s)", workers, incremental, resume)
+	with instrumentation.stage("edgar.build_partitions"):
+		if archive_path:
+			companies_status = _build_partitions_from_archive(companies_list, archive_path, workers, run_started if resume else None)
 		else:
-			logging.info(f"edgar.create_training_database: Dataframe for company {company} created. Attaching it to the main table")
-			try:
-				companies_table = pd.concat([companies_table, company_df])
-			except Exception as err:
-				logging.warning(f"edgar.create_training_database: Dataframe for company {company} cannot be attached to the main table - {err}")
-			else:
-				logging.info(f"edgar.create_training_database: Dataframe for company {company} attached to the main table")
-				companies_in_table +=1
-	logging.info(f"edgar.create_training_database: Main table created with {companies_in_table} companies")
-	if os.path.isfile(config.EDGAR_TRAINING_FILE):
-		logging.info(f"edgar.create_training_database: File {config.EDGAR_TRAINING_FILE} already exists")
-		backup_filename = config.BACKUP_PATH + "01_EDGAR_TRAINING_TABLE_" + datetime.datetime.now().strftime("%Y%m%d") + ".csv"
-		logging.info(f"edgar.create_training_database: Creating backup copy {backup_filename}.")
-		try:
-			shutil.copyfile(config.EDGAR_TRAINING_FILE, backup_filename)
-		except Exception as err:
-			logging.warning(f"edgar.create_training_database: Backup copy {backup_filename} cannot be created.")
-	logging.info(f"edgar.create_training_database: Storing main table into {config.EDGAR_TRAINING_FILE}")
+			companies_status = _build_partitions(companies_list, workers, incremental, run_started if resume else None)
+	for company, status in companies_status:
+		instrumentation.count("companies." + status.lower())
+		if status == "ERROR":
+			logging.warning("edgar.create_training_database: Partition for company %s cannot be created", company)
+		else:
+			logging.info("edgar.create_training_database: Partition for company %s %s", company, status.lower())
+			companies_in_table.append(company)
+	dataset.write_dataset_index(companies_in_table)
+	logging.info("edgar.create_training_database: Training dataset created with %s companies", len(companies_in_table))
+	logging.info("edgar.create_training_database: Exporting training dataset into %s", config.EDGAR_TRAINING_FILE)
 	try:
-		companies_table.to_csv(config.EDGAR_TRAINING_FILE)
+		with instrumentation.stage("dataset.export_csv"):
+			dataset.export_csv(config.EDGAR_TRAINING_FILE)
 	except Exception as err:
-		logging.error(f"edgar.create_training_database: The training database cannot be stored - {err}")
+		logging.error("edgar.create_training_database: The training database cannot be stored - %s", err)
 		return 0
 	else:
-		logging.info(f"edgar.create_training_database: Training database with {companies_in_table} companies stored into {config.EDGAR_TRAINING_FILE}")
-		return companies_in_table
+		logging.info("edgar.create_training_database: Storing version of %s into the raw store", config.EDGAR_TRAINING_FILE)
+		try:
+			rawstore.put_file(TRAINING_TABLE_NAME, config.EDGAR_TRAINING_FILE)
+		except Exception as err:
+			logging.warning("edgar.create_training_database: Version of %s cannot be stored - %s", config.EDGAR_TRAINING_FILE, err)
+		manifest.complete_run()
+		logging.info("edgar.create_training_database: Training database with %s companies stored into %s", len(companies_in_table), config.EDGAR_TRAINING_FILE)
+		return len(companies_in_table)
 	
 
-def download_company_raw_json(ticker=""):
+def _build_partitions(companies_list, workers, incremental=False, run_started=None):
+	"""Creates the training dataset partitions of the INDEX companies downloading their facts from EDGAR with a pool of worker threads.
+	Returns a list of (ticker, status) in INDEX order, with status "BUILT", "REUSED" or "ERROR"."""
+	with ThreadPoolExecutor(max_workers=workers) as executor:
+		#map returns the results in the INDEX order, whatever the order in which they are completed
+		build_company = lambda company: _build_company_partition(company, incremental, run_started)
+		return list(zip(companies_list, executor.map(build_company, companies_list)))
+
+
+def _build_partitions_from_archive(companies_list, archive_path, workers, run_started=None):
+	"""Creates the training dataset partitions of the INDEX companies reading their facts from the companyfacts.zip archive.
+	The facts are flattened in parallel by a pool of worker processes and the partitions are written by the calling process.
+	Only 2 x workers companies are submitted at a time, so the flattened tables waiting to be written never hold more than
+	a few companies in memory, whatever the size of the archive.
+	Returns a list of (ticker, status) in INDEX order, with status "BUILT", "REUSED" or "ERROR"."""
+	if not os.path.isfile(archive_path):
+		logging.error("edgar.create_training_database: Archive %s does not exist", archive_path)
+		return []
+	status = {}
+	pending = []
+	for ticker in companies_list:
+		if run_started is not None and manifest.built_since(ticker, run_started) and dataset.partition_exists(ticker):
+			status[ticker] = "REUSED"
+			continue
+		cik = cikindex.resolve_cik(ticker)
+		if cik:
+			pending.append((ticker, cik))
+		else:
+			logging.warning("edgar.create_training_database: CIK for company %s not available in the local CIK index", ticker)
+			status[ticker] = "ERROR"
+	logging.info("edgar.create_training_database: Flattening %s companies from %s", len(pending), archive_path)
+	#Stages and counters of the worker processes are not merged into the report: the flattening time is included in edgar.build_partitions
+	queued = iter(pending)
+	in_flight = {}
+	with ProcessPoolExecutor(max_workers=workers) as executor:
+		while True:
+			for ticker, cik in itertools.islice(queued, 2 * workers - len(in_flight)):
+				in_flight[executor.submit(_flatten_archive_member, archive_path, ticker, cik)] = ticker
+			if not in_flight:
+				break
+			done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+			for future in done:
+				ticker = in_flight.pop(future)
+				status[ticker] = _write_archive_partition(ticker, future)
+	return [(ticker, status[ticker]) for ticker in companies_list]
+
+
+def _write_archive_partition(ticker, future):
+	"""Adds the company information columns to the table flattened by a worker process (future) and stores its partition.
+	Returns "BUILT" if the partition has been created or "ERROR" otherwise"""
+	try:
+		company_df = future.result()
+	except Exception as err:
+		logging.error("edgar.create_training_database: Facts of company %s cannot be flattened - %s", ticker, err)
+		return "ERROR"
+	if company_df.empty:
+		return "ERROR"
+	_add_company_columns(company_df, ticker, offline=True)
+	if not dataset.write_partition(ticker, company_df):
+		return "ERROR"
+	#Not built from the downloaded content, so the next incremental build downloads and rebuilds it
+	manifest.update_entry(ticker, built=time.time(), rows=len(company_df), built_sha256=None)
+	return "BUILT"
+
+
+def _flatten_archive_member(archive_path, ticker, cik):
+	"""Reads the company facts of a company from the archive and flattens them. Runs in a worker process.
+	Returns the table of facts as a pandas dataframe or an empty dataframe in case of error"""
+	company_json = archive.read_company_json(archive_path, cik)
+	if not company_json:
+		return pd.DataFrame()
+	return create_table_from_json(company_json, ticker)
+
+
+@instrumentation.timed("edgar.download_company_facts")
+def download_company_facts(ticker="", conditional=False):
 	"""Downloads from EDGAR database the json with RAW data for the received company ticker and stores it into a json file.
-	Returns the downloaded json or an empty one in case of errors"""
-	logging.info(f"edgar.download_company_raw_json: Downloading company facts for ticker {ticker}")
-	json_empty = {}
+	The body is written to disk and hashed as it arrives, so the json is never held in memory.
+	If conditional is True, the request includes the ETag and Last-Modified of the previous download and, when EDGAR answers that the
+	data has not changed, the previously stored file is kept. The manifest records whether the content was modified.
+	Returns the path of the stored json file or an empty string in case of errors"""
+	logging.info("edgar.download_company_facts: Downloading company facts for ticker %s", ticker)
 	out_filename = config.DATABASE_PATH + ticker + ".json"
 	cik = get_cik(ticker)
 	if cik == "ERROR":
-		logging.error(f"edgar.download_company_raw_json: CIK for ticker {ticker} cannot be obtained")
-		return json_empty
+		logging.error("edgar.download_company_facts: CIK for ticker %s cannot be obtained", ticker)
+		return ""
 	url = config.companyFactsURL.format(cik)
-	logging.info(f"edgar.download_company_raw_json: Downloading from {url}")
+	headers = dict(config.EDGAR_HEADERS)
+	entry = manifest.get_entry(ticker)
+	if conditional and os.path.isfile(out_filename):
+		if entry.get("etag"):
+			headers["If-None-Match"] = entry["etag"]
+		if entry.get("last_modified"):
+			headers["If-Modified-Since"] = entry["last_modified"]
+	logging.info("edgar.download_company_facts: Downloading from %s", url)
 	try:
-		response = get(url, headers=config.EDGAR_HEADERS)
+		response = webclient.get(url, headers=headers, limiter=ratelimit.EDGAR, stream=True)
 	except Exception as err:
-		logging.error(f"edgar.download_company_raw_json: Download not possible - {err}")
-		return json_empty
+		logging.error("edgar.download_company_facts: Download not possible - %s", err)
+		return ""
+	tmp_filename = out_filename + ".tmp"
+	content_hash = hashlib.sha256()
+	with response:
+		if response.status_code == 304:
+			logging.info("edgar.download_company_facts: Company facts for ticker %s not modified. Keeping %s", ticker, out_filename)
+			manifest.update_entry(ticker, modified=False, downloaded=time.time())
+			return out_filename
+		if response.status_code == 204 or not response.headers.get("content-type", "").strip().startswith("application/json"):
+			logging.error("edgar.download_company_facts: Downloaded json is not valid - Code: %s / Type: %s", response.status_code, response.headers.get('content-type'))
+			return ""
+		received = 0
+		try:
+			with open(tmp_filename, 'wb') as f:
+				for chunk in response.iter_content(chunk_size=config.HTTP_CHUNK_SIZE):
+					content_hash.update(chunk)
+					f.write(chunk)
+					received += len(chunk)
+		except Exception as err:
+			logging.error("edgar.download_company_facts: The data cannot be stored - %s", err)
+			if os.path.isfile(tmp_filename):
+				os.remove(tmp_filename)
+			return ""
+		finally:
+			webclient.record_streamed_bytes(url, response, received)
+	logging.info("edgar.download_company_facts: Json downloaded.")
+	content_hash = content_hash.hexdigest()
+	modified = content_hash != entry.get("sha256") or not os.path.isfile(out_filename)
+	if not modified:
+		logging.info("edgar.download_company_facts: Content for ticker %s unchanged, keeping %s", ticker, out_filename)
+		os.remove(tmp_filename)
 	else:
-		logging.info(f"edgar.download_company_raw_json: Json downloaded.")
-		if (response.status_code != 204 and response.headers["content-type"].strip().startswith("application/json")):
-			try:
-				json_data = response.json()
-			except Exception as err:
-				logging.error(f"edgar.download_company_raw_table: Response format is not valid - {err}")
-				return json_empty
-			else:
-				if os.path.isfile(out_filename):
-					logging.info(f"edgar.download_company_raw_table: File {out_filename} already exists.")
-					backup_filename = config.BACKUP_PATH + ticker + "_" + datetime.datetime.now().strftime("%Y%m%d") + ".json"
-					logging.info(f"edgar.download_company_raw_table: Creating backup copy {backup_filename}.")
-					try:
-						shutil.copyfile(out_filename, backup_filename)
-					except Exception as err:
-						logging.warning(f"edgar.download_company_raw_table: Backup copy {backup_filename} cannot be created.")
-				logging.info(f"edgar.download_company_raw_table: Storing json into {out_filename}.")
-				with open(out_filename, 'w') as f:
-					try:
-						json.dump(json_data, f)
-					except Exception as err:
-						logging.error(f"edgar.download_company_raw_table: The data cannot be stored - {err}")
-						return json_empty
-					else:
-						logging.info(f"edgar.download_company_raw_table: Raw json file stored.")
-						return json_data
-		else:
-			logging.error(f"edgar.download_company_raw_table: Downloaded json is not valid - Code: {response.status_code} / Type: {response.headers['content-type']}")
-			return json_empty
+		os.replace(tmp_filename, out_filename)
+		logging.info("edgar.download_company_facts: Raw json file stored into %s.", out_filename)
+		try:
+			rawstore.put_file(ticker, out_filename, content_hash)
+		except Exception as err:
+			logging.warning("edgar.download_company_facts: Version of %s cannot be stored into the raw store - %s", out_filename, err)
+	manifest.update_entry(ticker, etag=response.headers.get("ETag"), last_modified=response.headers.get("Last-Modified"),
+		sha256=content_hash, modified=modified, downloaded=time.time())
+	return out_filename
 
 
-def create_table_for_company(ticker=""):
+def download_company_raw_json(ticker="", conditional=False):
+	"""Downloads from EDGAR database the json with RAW data for the received company ticker and stores it into a json file
+	(see download_company_facts).
+	Returns the downloaded json or an empty one in case of errors"""
+	facts_file = download_company_facts(ticker, conditional)
+	if not facts_file:
+		return {}
+	try:
+		with open(facts_file, 'r') as f:
+			return json.load(f)
+	except Exception as err:
+		logging.error("edgar.download_company_raw_json: Stored json %s cannot be read - %s", facts_file, err)
+		return {}
+
+
+def _build_company_partition(ticker="", incremental=False, run_started=None):
+	"""Creates and stores the training dataset partition of a company. Runs in a worker and never raises, so one company cannot stop the pool.
+	Returns "BUILT" if the partition has been created, "REUSED" if the existing partition is still valid or "ERROR" otherwise"""
+	logging.info("edgar.create_training_database: Creating partition for company %s", ticker)
+	try:
+		if run_started is not None and manifest.built_since(ticker, run_started) and dataset.partition_exists(ticker):
+			logging.info("edgar.create_training_database: Company %s already built in the resumed run", ticker)
+			return "REUSED"
+		facts_file = None
+		if incremental:
+			facts_file = download_company_facts(ticker, conditional=True)
+			entry = manifest.get_entry(ticker)
+			#The partition is reused only if it was built from the content stored now: a download that modified the content
+			#but whose build failed is rebuilt even if the next request answers that nothing has changed since that download
+			built_from_stored = entry.get("sha256") and entry.get("built_sha256") == entry["sha256"]
+			if dataset.partition_exists(ticker) and entry.get("built") and (not facts_file or built_from_stored):
+				if not facts_file:
+					logging.warning("edgar.create_training_database: Company facts for %s cannot be refreshed, keeping previous partition", ticker)
+				return "REUSED"
+			if not facts_file:
+				return "ERROR"
+		company_df = create_table_for_company(ticker, facts_file=facts_file)
+		if company_df.empty or not dataset.write_partition(ticker, company_df):
+			return "ERROR"
+		manifest.update_entry(ticker, built=time.time(), rows=len(company_df), built_sha256=manifest.get_entry(ticker).get("sha256"))
+		return "BUILT"
+	except Exception as err:
+		logging.error("edgar.create_training_database: Unexpected error creating partition for company %s - %s", ticker, err)
+		return "ERROR"
+
+
+@instrumentation.timed("edgar.create_table_for_company")
+def create_table_for_company(ticker="", company_json=None, facts_file=None):
 	"""Obtains from EDGAR database a table formatted for training for the provided ticker.
+	If company_json or the path of an already downloaded facts_file is provided, it is used instead of downloading the company facts again.
 	Returns the table as a pandas dataframe or an emptz dataframe in case of error"""
-	logging.info(f"edgar.create_table_for_company: Creating company table for ticker {ticker}")
+	logging.info("edgar.create_table_for_company: Creating company table for ticker %s", ticker)
 	company_table = pd.DataFrame()
 	if not ticker:
-		logging.error(f"edgar.create_table_for_company: Ticker empty.")
-		return company_table
-	company_json = download_company_raw_json(ticker)
-	if not company_json:
-		logging.error(f"edgar.create_table_for_company: Json empty. The table cannot be created for ticker {ticker}")
+		logging.error("edgar.create_table_for_company: Ticker empty.")
 		return company_table
+	if company_json is not None:
+		if not company_json:
+			logging.error("edgar.create_table_for_company: Json empty. The table cannot be created for ticker %s", ticker)
+			return company_table
+		company_table = create_table_from_json(company_json, ticker)
 	else:
-		if "us-gaap" not in company_json['facts']:
-			logging.error(f"edgar.create_table_for_company: Json not formatted as expected, us-gaap key missing. The table cannot be created for ticker {ticker}")
+		if facts_file is None:
+			facts_file = download_company_facts(ticker)
+		if not facts_file:
+			logging.error("edgar.create_table_for_company: Company facts not available. The table cannot be created for ticker %s", ticker)
 			return company_table
-		for financial_concept in company_json['facts']['us-gaap'].keys():
-			logging.info(f"edgar.create_table_for_company: Getting financial concept {financial_concept}")
-			financial_concept_unit = list(company_json['facts']['us-gaap'][financial_concept]['units'])[0]
-			logging.info(f"edgar.create_table_for_company: Unit for financial concept {financial_concept}: {financial_concept_unit}")
-			financial_concept_json_array = []
-			try:
-				financial_concept_json_array = company_json['facts']['us-gaap'][financial_concept]['units'][financial_concept_unit]
-			except Exception as err:
-				logging.warning(f"edgar.create_table_for_company: Not possible to obtain financial concept {financial_concept} - {err}")
-			else:
-				logging.info(f"edgar.create_table_for_company: Array found for financial concept {financial_concept}")
-			if not financial_concept_json_array:
-				logging.warning(f"edgar.create_table_for_company: Array for financial concept {financial_concept} is empty")
-			else:
-				logging.info(f"edgar.create_table_for_company: Creating dataframe from financial concept array")
-				try:
-					financial_concept_df = pd.json_normalize(financial_concept_json_array)[['val', 'fy', 'form', 'frame']]
-				except Exception as err:
-					logging.warning(f"edgar.create_table_for_company: Dataframe for financial concept {financial_concept} cannot be created - {err}")
-				else:
-					financial_concept_df['unit'] = financial_concept_unit
-					financial_concept_df['concept'] = financial_concept
-					logging.info(f"edgar.create_table_for_company: Appending financial concept dataframe to company table dataframe")
-					company_table = pd.concat([company_table, financial_concept_df])
-		logging.info(f"edgar.create_table_for_company: Adding company information columns")
-		company_table['ticker'] = ticker
-		company_table['sector'] = yahoo.get_company_sector(ticker)
-		company_table['industry'] = yahoo.get_company_industry(ticker)
-		company_table['activity'] = get_activity(ticker)
-		company_table['sic'] = get_sic(ticker)
-		logging.info(f"edgar.create_table_for_company: Table for ticker {ticker} created")
+		company_table = create_table_from_file(facts_file, ticker)
+		if company_table.empty:
+			#The stored file is not valid: its validators are cleared so it is downloaded again next time
+			manifest.update_entry(ticker, etag=None, last_modified=None, sha256=None)
+	if company_table.empty:
 		return company_table
+	_add_company_columns(company_table, ticker)
+	logging.info("edgar.create_table_for_company: Table for ticker %s created", ticker)
+	return company_table
 
 
-def get_cik(ticker=""):
-	"""provides EDGAR CIK number for the provided ticker"""
+def _add_company_columns(company_table, ticker="", offline=False):
+	"""Adds the company information columns (ticker, sector, industry, activity, sic) to a table of facts.
+	In offline mode the information is taken only from the caches"""
+	logging.info("edgar.create_table_for_company: Adding company information columns")
+	profile = yahoo.get_company_profile(ticker, offline)
+	metadata = get_company_metadata(ticker, offline)
+	company_table['ticker'] = ticker
+	company_table['sector'] = profile["sector"]
+	company_table['industry'] = profile["industry"]
+	company_table['activity'] = metadata["activity"]
+	company_table['sic'] = metadata["sic"]
+
+
+@instrumentation.timed("edgar.create_table_from_json")
+def create_table_from_json(company_json, ticker=""):
+	"""Creates the table of financial facts (val, fy, form, frame, unit, concept, end, filed, accn) from a company facts json.
+	All the us-gaap concepts and units are flattened in a single pass.
+	Returns the table as a pandas dataframe or an empty dataframe in case of error"""
+	if "us-gaap" not in company_json.get('facts', {}):
+		logging.error("edgar.create_table_from_json: Json not formatted as expected, us-gaap key missing. The table cannot be created for ticker %s", ticker)
+		return pd.DataFrame()
+	try:
+		columns = facts.flatten_company_facts(company_json)
+	except Exception as err:
+		logging.error("edgar.create_table_from_json: Financial facts cannot be flattened for ticker %s - %s", ticker, err)
+		return pd.DataFrame()
+	return _facts_table(columns, ticker)
+
+
+@instrumentation.timed("edgar.create_table_from_file")
+def create_table_from_file(facts_file, ticker=""):
+	"""Creates the table of financial facts (val, fy, form, frame, unit, concept, end, filed, accn) from a company facts json file.
+	The file is parsed incrementally when ijson is installed (facts module), so the memory needed depends on the facts
+	produced and not on the size of the json.
+	Returns the table as a pandas dataframe or an empty dataframe in case of error"""
+	try:
+		with open(facts_file, 'rb') as f:
+			columns = facts.flatten_company_facts_file(f)
+	except Exception as err:
+		logging.error("edgar.create_table_from_file: Financial facts cannot be flattened from %s for ticker %s - %s", facts_file, ticker, err)
+		return pd.DataFrame()
+	if not len(columns['val']):
+		logging.error("edgar.create_table_from_file: No us-gaap facts found in %s. The table cannot be created for ticker %s", facts_file, ticker)
+		return pd.DataFrame()
+	return _facts_table(columns, ticker)
+
+
+def _facts_table(columns, ticker=""):
+	"""Creates the table of financial facts from the flattened columns (facts module)"""
+	company_table = pd.DataFrame(columns, columns=facts.FACT_COLUMNS)
+	company_table['fy'] = company_table['fy'].astype("Int32")
+	logging.info("edgar._facts_table: %s facts of %s financial concepts obtained for ticker %s", len(company_table), company_table['concept'].nunique(), ticker)
+	return company_table
+
+
+@instrumentation.timed("edgar.get_company_metadata")
+def get_company_metadata(ticker="", offline=False):
+	"""Obtains the CIK, SIC and activity of the provided ticker (or CIK) from the EDGAR browse page.
+	The page is downloaded and its fields extracted (htmlextract module) only once and the result is stored in the metadata cache, so it is not requested
+	again until the cache entry expires. In offline mode only the cache is used (expired entries included).
+	Returns a dictionary with keys cik, sic and activity. Fields that cannot be obtained are "ERROR" (cik) or "N/A" (sic, activity)"""
+	metadata = cache.get(config.EDGAR_METADATA_CACHE_FILE, ticker, float("inf") if offline else config.EDGAR_METADATA_CACHE_TTL)
+	if metadata is not None:
+		return metadata
+	metadata = {"cik": "ERROR", "sic": "N/A", "activity": "N/A"}
+	if offline:
+		return metadata
 	url = config.BROWSE_URL.format(ticker)
-	logging.info(f"edgar.get_cik: Getting CIK from {url}")
+	logging.info("edgar.get_company_metadata: Getting company metadata from %s", url)
 	try:
-		f = get(url, stream = True, headers=config.EDGAR_HEADERS)
+		f = webclient.get(url, headers=config.EDGAR_HEADERS, limiter=ratelimit.EDGAR)
 	except Exception as err:
-		logging.warning(f"edgar.get_cik: Edgar CIK cannot be obtained - {err}")
-		return "ERROR"
+		logging.warning("edgar.get_company_metadata: Company metadata cannot be obtained - %s", err)
+		return metadata
+	if f.status_code != 200 or config.ERROR_MESSAGE1 in f.text or config.ERROR_MESSAGE2 in f.text:
+		logging.warning("edgar.get_company_metadata: Company metadata cannot be obtained for %s - %s", ticker, f.status_code)
+		return metadata
+	info = htmlextract.edgar_company_info(f.text)
+	cik = info["cik"]
+	if cik is None:
+		logging.warning("edgar.get_company_metadata: CIK not found for %s", ticker)
+		return metadata
+	if len(cik) != 10 or not cik.isdigit():
+		logging.warning("edgar.get_company_metadata: Retrieved CIK %s is not well formatted", cik)
+		return metadata
+	metadata["cik"] = cik
+	if info["sic"] is None:
+		logging.warning("edgar.get_company_metadata: SIC not found for %s", ticker)
+	elif check_sic(info["sic"]):
+		metadata["sic"] = info["sic"]
 	else:
-		if config.ERROR_MESSAGE1 in str(f.content) or config.ERROR_MESSAGE1 in str(f.content):
-			logging.warning(f"edgar.get_cik: Edgar CIK cannot be obtained.")
-			return "ERROR"
-		else:
-			soup = BeautifulSoup(f.text, "html.parser")
-			cik = soup.find_all("span", class_="companyName")[0].text.split("CIK#:")[1].split()[0]
-			if check_cik(cik):
-				logging.info(f"edgar.get_cik: CIK for {ticker}: {cik}")
-				return cik
-			else:
-				logging.warning(f"edgar.get_cik: Retrieved CIK is not well formatted - {err}")
-				return "ERROR"
-			
+		logging.warning("edgar.get_company_metadata: Retrieved SIC %s is not valid", info['sic'])
+	if info["activity"] is None:
+		logging.warning("edgar.get_company_metadata: Activity not found for %s", ticker)
+	else:
+		metadata["activity"] = info["activity"]
+	logging.info("edgar.get_company_metadata: Metadata for %s: %s", ticker, metadata)
+	cache.put(config.EDGAR_METADATA_CACHE_FILE, ticker, metadata)
+	return metadata
+
+
+def get_cik(ticker=""):
+	"""provides EDGAR CIK number for the provided ticker.
+	The CIK is resolved from the local CIK index and EDGAR is requested only for tickers not indexed"""
+	cik = cikindex.resolve_cik(ticker)
+	if cik:
+		logging.info("edgar.get_cik: CIK for %s from local index: %s", ticker, cik)
+		return cik
+	cik = get_company_metadata(ticker)["cik"]
+	if cik == "ERROR":
+		logging.warning("edgar.get_cik: Edgar CIK cannot be obtained for %s", ticker)
+	else:
+		logging.info("edgar.get_cik: CIK for %s: %s", ticker, cik)
+		cikindex.add_cik(ticker, cik)
+	return cik
+
 
 def check_cik(cik=""):
 	"""Checks if the provided cik is a valid CIK number in EDGAR database"""
-	url = config.DOWNLOAD_URL.format(cik) + "/index.json"
 	if len(cik) != 10 or not cik.isdigit():
-		logging.warning(f"edgar.check_cik: CIK {cik} not valid: must have 10 numbers")
+		logging.warning("edgar.check_cik: CIK %s not valid: must have 10 numbers", cik)
 		return False
-	logging.info(f"edgar.check_cik: Checking connection to {url}")
-	try:
-		f = get(url, stream = True, headers=config.EDGAR_HEADERS)
-	except Exception as err:
-		logging.warning(f"edgar.check_cik: Cannot connect to edgar with CIK {cik}")
+	if get_company_metadata(cik)["cik"] != cik:
+		logging.warning("edgar.check_cik: CIK %s not found in EDGAR database", cik)
 		return False
-	else:
-		if f.status_code != 200:
-			logging.warning(f"edgar.check_cik: Connection to EDGAR database not possible with CIK {cik} - {f.status_code}")
-			return False
-		else:
-			logging.info(f"edgar.check_cik: CIK {cik} is valid")
-			return True
+	logging.info("edgar.check_cik: CIK %s is valid", cik)
+	return True
+
 
 def get_activity(ticker=""):
 	"""gets company activity from EDGAR database for the provided ticker"""
-	url = config.BROWSE_URL.format(ticker)
-	logging.info(f"edgar.get_activity: Getting company activity from {url}")
-	try:
-		f = get(url, stream = True, headers=config.EDGAR_HEADERS)
-	except Exception as err:
-		logging.warning(f"edgar.get_activity: Company activity cannot be obtained - {err}")
-		return "N/A"
-	else:
-		if config.ERROR_MESSAGE1 in str(f.content) or config.ERROR_MESSAGE1 in str(f.content):
-			logging.warning(f"edgar.get_activity: Company activity cannot be obtained.")
-			return "N/A"
-		else:
-			soup = BeautifulSoup(f.text, "html.parser")
-			try:
-				activity = str(soup.find("p", class_="identInfo").find_all("a")[0].next_element.next_element).split("- ")[1].replace(",", " &")
-			except AttributeError as err:
-				logging.warning(f"edgar.get_activity: Activity not found for ticker {ticker} - {err}")
-				return "N/A"
-			except Exception as err:
-				logging.warning(f"edgar.get_activity: Activity not found for ticker {ticker} - {err}")
-				return "N/A"
-			else:
-				logging.info(f"edgar.get_activity: Activity found for {ticker}: {activity}")
-				return activity
+	activity = get_company_metadata(ticker)["activity"]
+	logging.info("edgar.get_activity: Activity for %s: %s", ticker, activity)
+	return activity
 
 
 def get_sic(ticker=""):
 	"""gets company SIC (Standard Industrial Code) from EDGAR database for the provided ticker"""
-	url = config.BROWSE_URL.format(ticker)
-	logging.info(f"edgar.get_sic: Getting company SIC from {url}")
-	try:
-		f = get(url, stream = True, headers=config.EDGAR_HEADERS)
-	except Exception as err:
-		logging.warning(f"edgar.get_sic: Company SIC cannot be obtained - {err}")
-		return "N/A"
-	else:
-		if config.ERROR_MESSAGE1 in str(f.content) or config.ERROR_MESSAGE1 in str(f.content):
-			logging.warning(f"edgar.get_sic: Company SIC cannot be obtained.")
-			return "N/A"
-		else:
-			soup = BeautifulSoup(f.text, "html.parser")
-			try:
-				sic = str(soup.find("p", class_="identInfo").find_all("a")[0].next_element)
-			except AttributeError as err:
-				logging.warning(f"edgar.get_sic: SIC not found for ticker {ticker} - {err}")
-				return "N/A"
-			except Exception as err:
-				logging.warning(f"edgar.get_sic: SIC not found for ticker {ticker} - {err}")
-				return "N/A"
-			else:
-				if not check_sic(sic):
-					logging.warning(f"edgar.get_sic: Retrieved SIC {sic} is not valid")
-					return "N/A"
-				else:
-					logging.info(f"edgar.get_sic: SIC found for {ticker}: {sic}")
-					return sic
+	sic = get_company_metadata(ticker)["sic"]
+	logging.info("edgar.get_sic: SIC for %s: %s", ticker, sic)
+	return sic
 
 
 def check_sic(sic=""):
 	"""Checks if the provided sic has a valid format"""
 	if len(sic) != 4 or not sic.isdigit():
-		logging.warning(f"edgar.check_sic: SIC {sic} not valid: must have 4 numbers")
+		logging.warning("edgar.check_sic: SIC %s not valid: must have 4 numbers", sic)
 		return False
 	else:
-		logging.info(f"edgar.check_sic: SIC {sic} valid")
+		logging.info("edgar.check_sic: SIC %s valid", sic)
 		return True
\ No newline at end of file
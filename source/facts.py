@@ -0,0 +1,79 @@
+#This library contains tools to flatten the EDGAR company facts json into typed columns.
+
+import json
+import logging
+import numpy as np
+
+#ijson is used to parse company facts files incrementally when it is installed, otherwise files are loaded whole
+#(pip install ijson)
+try:
+	import ijson
+except ImportError:
+	ijson = None
+#The fallback to loading whole files is reported only once per process
+_fallback_reported = False
+
+#Columns produced for every fact, in the order used by the training table
+FACT_COLUMNS = ['val', 'fy', 'form', 'frame', 'unit', 'concept', 'end', 'filed', 'accn']
+
+
+def _append_concept(columns, concept, concept_json):
+	"""Appends the facts of all the units of a concept to the column buffers {column: list}"""
+	val, fy, form, frame = columns['val'], columns['fy'], columns['form'], columns['frame']
+	unit_column, concept_column = columns['unit'], columns['concept']
+	end, filed, accn = columns['end'], columns['filed'], columns['accn']
+	for unit, facts in concept_json.get('units', {}).items():
+		if not facts:
+			continue
+		val.extend([fact.get('val') for fact in facts])
+		fy.extend([fact.get('fy') for fact in facts])
+		form.extend([fact.get('form') for fact in facts])
+		frame.extend([fact.get('frame') for fact in facts])
+		end.extend([fact.get('end') for fact in facts])
+		filed.extend([fact.get('filed') for fact in facts])
+		accn.extend([fact.get('accn') for fact in facts])
+		unit_column.extend([unit] * len(facts))
+		concept_column.extend([concept] * len(facts))
+
+
+def _to_arrays(columns):
+	"""Converts the column buffers into the typed numpy arrays returned by the flatteners"""
+	return {
+		'val': np.array(columns['val'], dtype=np.float64),
+		'fy': np.array(columns['fy'], dtype=np.float64),
+		'form': np.array(columns['form'], dtype=object),
+		'frame': np.array(columns['frame'], dtype=object),
+		'unit': np.array(columns['unit'], dtype=object),
+		'concept': np.array(columns['concept'], dtype=object),
+		'end': np.array(columns['end'], dtype='datetime64[D]'),
+		'filed': np.array(columns['filed'], dtype='datetime64[D]'),
+		'accn': np.array(columns['accn'], dtype=object),
+	}
+
+
+def flatten_company_facts(company_json, taxonomy="us-gaap"):
+	"""Flattens all the facts of a taxonomy of a company facts json in a single pass.
+	All the units of every concept are kept.
+	Returns a dictionary {column: numpy array} with the FACT_COLUMNS: val and fy as float64 (NaN if missing),
+	end and filed as datetime64[D] and the rest as object arrays"""
+	columns = {name: [] for name in FACT_COLUMNS}
+	for concept, concept_json in company_json.get('facts', {}).get(taxonomy, {}).items():
+		_append_concept(columns, concept, concept_json)
+	return _to_arrays(columns)
+
+
+def flatten_company_facts_file(f, taxonomy="us-gaap"):
+	"""Flattens all the facts of a taxonomy from a company facts json file opened in binary mode.
+	If ijson is installed the file is parsed incrementally, one concept at a time, so only the column buffers and the concept
+	being parsed are held in memory instead of the object tree of the whole json. Otherwise the json is loaded whole.
+	Returns the same columns as flatten_company_facts"""
+	global _fallback_reported
+	if ijson is None:
+		if not _fallback_reported:
+			_fallback_reported = True
+			logging.warning("facts.flatten_company_facts_file: ijson is not installed, company facts files are loaded whole into memory (pip install ijson)")
+		return flatten_company_facts(json.load(f), taxonomy)
+	columns = {name: [] for name in FACT_COLUMNS}
+	for concept, concept_json in ijson.kvitems(f, "facts." + taxonomy, use_float=True):
+		_append_concept(columns, concept, concept_json)
+	return _to_arrays(columns)
@@ -0,0 +1,157 @@
+#This library contains the feature matrix stage that runs after the training database creation.
+#It converts the long table of facts into a wide float32 matrix with one row per (ticker, fiscal year)
+#and one column per financial concept, which is the input expected by the models.
+#The rows of every company are cached on disk and recomputed only when its partition changes; the caches of the
+#companies that leave the dataset are deleted when the matrix of the whole dataset is built.
+#It runs with: python sarai.py features
+
+import logging
+import os
+import numpy as np
+import pandas as pd
+import configuration as config
+import dataset
+
+#Priority used to choose one value when a company has several facts for the same fiscal year and concept
+#(comparative periods, quarterly values, amendments, several units...). Facts are sorted with these keys and
+#the first one is kept:
+# 1. Annual forms (10-K, 10-K/A, 20-F, 40-F) before the rest
+# 2. The latest period end, so the values of the fiscal year are chosen over the comparatives of previous years
+# 3. Facts with an annual frame (CY2020) before quarterly (CY2020Q4) or missing frames
+# 4. The latest filing date, so amendments replace the original values
+# 5. Facts in USD before other units
+# 6. The highest accession number
+ANNUAL_FORMS = ['10-K', '10-K/A', '20-F', '20-F/A', '40-F', '40-F/A']
+
+
+def _cache_path(ticker=""):
+	"""Returns the path of the cached feature rows of the provided ticker"""
+	return config.EDGAR_FEATURES_PATH + ticker + ".npz"
+
+
+def _partition_stamp(ticker=""):
+	"""Returns a string that changes every time the partition of the ticker is written"""
+	status = os.stat(dataset.partition_path(ticker))
+	return f"{status.st_mtime_ns}-{status.st_size}"
+
+
+def company_feature_rows(company_table):
+	"""Converts the facts of a company into its feature rows applying the duplicate rule described in ANNUAL_FORMS.
+	Returns (fiscal years as int32 array, concepts as array, values as float32 matrix fiscal years x concepts)"""
+	facts = company_table[company_table['fy'].notna() & company_table['val'].notna()]
+	keys = pd.DataFrame({
+		'fy': facts['fy'].astype('int32').to_numpy(),
+		'concept': facts['concept'].astype(object).to_numpy(),
+		'val': facts['val'].to_numpy(dtype='float64'),
+		'annual_form': facts['form'].isin(ANNUAL_FORMS).to_numpy(),
+		'end': pd.to_datetime(facts['end']).to_numpy(),
+		'annual_frame': facts['frame'].fillna("").str.match(r"^CY\d{4}$").to_numpy(dtype=bool),
+		'filed': pd.to_datetime(facts['filed']).to_numpy(),
+		'usd': (facts['unit'] == "USD").to_numpy(dtype=bool),
+		'accn': facts['accn'].fillna("").astype(object).to_numpy(),
+	})
+	keys = keys.sort_values(['fy', 'concept', 'annual_form', 'end', 'annual_frame', 'filed', 'usd', 'accn'],
+		ascending=[True, True, False, False, False, False, False, False], na_position='last', kind='mergesort')
+	keys = keys.drop_duplicates(['fy', 'concept'], keep='first')
+	wide = keys.pivot(index='fy', columns='concept', values='val')
+	return wide.index.to_numpy(dtype='int32'), wide.columns.to_numpy(dtype=object), wide.to_numpy(dtype='float32')
+
+
+def _load_company_features(ticker=""):
+	"""Returns the feature rows of a company from the cache, recomputing and caching them if its partition has changed.
+	Returns (fiscal years, concepts, values) or None in case of error"""
+	path = _cache_path(ticker)
+	stamp = _partition_stamp(ticker)
+	if os.path.isfile(path):
+		try:
+			#Caches written with the concepts as an object array cannot be read without pickle and are computed again
+			with np.load(path) as cached:
+				if str(cached['stamp']) == stamp:
+					return cached['fy'], cached['concepts'], cached['values']
+		except Exception as err:
+			logging.warning("features._load_company_features: Cache %s cannot be read - %s", path, err)
+	logging.info("features._load_company_features: Computing feature rows for ticker %s", ticker)
+	company_table = dataset.read_partition(ticker)
+	if company_table.empty:
+		return None
+	fy, concepts, values = company_feature_rows(company_table)
+	#Stored as a string array, so the cache is read without unpickling objects
+	concepts = concepts.astype(str)
+	try:
+		os.makedirs(config.EDGAR_FEATURES_PATH, exist_ok=True)
+		with open(path + ".tmp", 'wb') as f:
+			np.savez(f, fy=fy, concepts=concepts, values=values, stamp=np.array(stamp))
+		os.replace(path + ".tmp", path)
+	except Exception as err:
+		logging.warning("features._load_company_features: Cache %s cannot be written - %s", path, err)
+	return fy, concepts, values
+
+
+def prune_feature_cache():
+	"""Deletes the cached feature rows of the tickers that are no longer in the training dataset.
+	Returns the number of caches deleted"""
+	if not os.path.isdir(config.EDGAR_FEATURES_PATH):
+		return 0
+	tickers = set(dataset.read_dataset_index())
+	deleted = 0
+	for name in os.listdir(config.EDGAR_FEATURES_PATH):
+		if not name.endswith(".npz") or name[:-len(".npz")] in tickers:
+			continue
+		try:
+			os.remove(config.EDGAR_FEATURES_PATH + name)
+			deleted += 1
+		except OSError as err:
+			logging.warning("features.prune_feature_cache: Cache %s cannot be deleted - %s", name, err)
+	if deleted:
+		logging.info("features.prune_feature_cache: %s caches of tickers no longer in the dataset deleted", deleted)
+	return deleted
+
+
+def build_feature_matrix(tickers=None, sparse=False):
+	"""Builds the feature matrix of the training dataset (or of the provided tickers): one float32 row per (ticker, fiscal year)
+	and one column per concept, NaN where a company does not report a concept.
+	Only the companies whose partition has changed since the last call are recomputed.
+	Returns a pandas dataframe indexed by (ticker, fy). If sparse is True and scipy is installed, a sparse dataframe is returned
+	where the concepts not reported are not stored (implicit zeros) instead of NaN.
+	When the whole dataset is built, the caches of the tickers that left it are deleted"""
+	if tickers is None:
+		prune_feature_cache()
+	blocks = []
+	for ticker in (dataset.read_dataset_index() if tickers is None else tickers):
+		if not dataset.partition_exists(ticker):
+			logging.warning("features.build_feature_matrix: Partition for ticker %s not found", ticker)
+			continue
+		company_features = _load_company_features(ticker)
+		if company_features is not None:
+			blocks.append((ticker,) + tuple(company_features))
+	concepts = np.unique(np.concatenate([block[2] for block in blocks]).astype(str)) if blocks else np.empty(0, dtype=str)
+	rows = sum(len(block[1]) for block in blocks)
+	index = pd.MultiIndex.from_arrays([
+		np.repeat([block[0] for block in blocks], [len(block[1]) for block in blocks]),
+		np.concatenate([block[1] for block in blocks]) if blocks else np.empty(0, dtype='int32')], names=['ticker', 'fy'])
+	#Position of every company concept in the global list of concepts
+	positions = [np.searchsorted(concepts, block[2].astype(str)) for block in blocks]
+	if sparse:
+		try:
+			from scipy import sparse as scipy_sparse
+		except ImportError:
+			logging.warning("features.build_feature_matrix: scipy is not installed, building a dense matrix")
+		else:
+			row_ids, column_ids, data = [], [], []
+			offset = 0
+			for block, position in zip(blocks, positions):
+				block_rows, block_columns = np.nonzero(~np.isnan(block[3]))
+				row_ids.append(block_rows + offset)
+				column_ids.append(position[block_columns])
+				data.append(block[3][block_rows, block_columns])
+				offset += len(block[1])
+			matrix = scipy_sparse.coo_matrix((np.concatenate(data) if data else [], (np.concatenate(row_ids) if row_ids else [], np.concatenate(column_ids) if column_ids else [])),
+				shape=(rows, len(concepts)), dtype='float32').tocsr()
+			return pd.DataFrame.sparse.from_spmatrix(matrix, index=index, columns=concepts)
+	matrix = np.full((rows, len(concepts)), np.nan, dtype='float32')
+	offset = 0
+	for block, position in zip(blocks, positions):
+		matrix[offset:offset + len(block[1]), position] = block[3]
+		offset += len(block[1])
+	logging.info("features.build_feature_matrix: Feature matrix with %s rows and %s concepts built", rows, len(concepts))
+	return pd.DataFrame(matrix, index=index, columns=concepts)
@@ -0,0 +1,101 @@
+#This library contains the extraction of the company fields from the EDGAR browse page and the Yahoo
+#profile page. Instead of building the tree of the whole page, only the element holding each field is
+#located with compiled patterns and only that small region is decoded, which is much faster on the
+#large pages (the Yahoo profile page is mostly scripts).
+#The rules are the same used before with BeautifulSoup, so the extracted values do not change.
+
+import html
+import re
+
+_SCRIPT_OPEN = "<script"
+_SCRIPT_CLOSE = "</script"
+_TAG = re.compile(r"<[^>]*>")
+_COMPANY_NAME = re.compile(r"""<span\b[^>]*\bclass\s*=\s*["'](?:[^"']*\s)?companyName(?:\s[^"']*)?["'][^>]*>""", re.IGNORECASE)
+_IDENT_INFO = re.compile(r"""<p\b[^>]*\bclass\s*=\s*["'](?:[^"']*\s)?identInfo(?:\s[^"']*)?["'][^>]*>""", re.IGNORECASE)
+_LINK = re.compile(r"<a\b[^>]*>", re.IGNORECASE)
+_LINK_TEXT = re.compile(r"([^<]*)(</a\s*>([^<]*))?", re.IGNORECASE)
+_DT = re.compile(r"<dt[\s>]", re.IGNORECASE)
+_DT_CLOSE = re.compile(r"</dt\s*>", re.IGNORECASE)
+_NEXT_TAG = re.compile(r"<(/?)([a-zA-Z][\w-]*)[^>]*>")
+
+
+def _in_script(page, position):
+	"""Checks if position is inside a script element of page, where the markup is only text"""
+	start = page.rfind(_SCRIPT_OPEN, 0, position)
+	return start >= 0 and page.rfind(_SCRIPT_CLOSE, start, position) < 0
+
+
+def _search(pattern, page, position=0):
+	"""Returns the first match of pattern in page from position that is not inside a script element, or None"""
+	match = pattern.search(page, position)
+	while match is not None and _in_script(page, match.start()):
+		match = pattern.search(page, match.end())
+	return match
+
+
+def _element_text(page, match, tag):
+	"""Returns the text of the element opened by match (markup removed and entities decoded) or None if it is not closed"""
+	end = page.find("</" + tag, match.end())
+	if end < 0:
+		return None
+	return html.unescape(_TAG.sub("", page[match.end():end]))
+
+
+def edgar_company_info(page=""):
+	"""Extracts the CIK, SIC and activity from an EDGAR browse page.
+	CIK is the first word after "CIK#:" in the first span of class companyName. SIC is the text of the first link of the
+	paragraph of class identInfo and activity the text after that link, from "- " on, with commas replaced by " &". Both fields
+	are extracted independently: SIC is returned even if the text after the link has no "- ".
+	Returns a dictionary with keys cik, sic and activity, None for the fields not found"""
+	info = {"cik": None, "sic": None, "activity": None}
+	match = _search(_COMPANY_NAME, page)
+	text = _element_text(page, match, "span") if match else None
+	if text and "CIK#:" in text:
+		words = text.split("CIK#:")[1].split()
+		info["cik"] = words[0] if words else None
+	match = _search(_IDENT_INFO, page)
+	end = page.find("</p", match.end()) if match else -1
+	link = _LINK.search(page, match.end(), end if end >= 0 else len(page)) if match else None
+	if link:
+		#Text of the link and text following it, when the link holds only text
+		text = _LINK_TEXT.match(page, link.end())
+		if text.group(1):
+			info["sic"] = html.unescape(text.group(1))
+		following = html.unescape(text.group(3)).split("- ") if text.group(1) and text.group(3) else []
+		if len(following) > 1:
+			info["activity"] = following[1].replace(",", " &")
+	return info
+
+
+def _definition_value(page, match, part):
+	"""Returns the text of the first element following the dt element opened by match: part is the position of the text
+	in the markup of that element (1 for the text of the element, 2 for the text of its first child element).
+	Returns None if there is no such element"""
+	close = _DT_CLOSE.search(page, match.end())
+	if close is None:
+		return None
+	sibling = _NEXT_TAG.search(page, close.end())
+	#A closing tag means that the dt element is the last one of its parent
+	if sibling is None or sibling.group(1):
+		return None
+	end = page.find("</" + sibling.group(2), sibling.end())
+	markup = page[sibling.start():end if end >= 0 else len(page)]
+	pieces = markup.split(">")
+	if len(pieces) <= part:
+		return None
+	return html.unescape(pieces[part].split("<")[0]).rstrip()
+
+
+def yahoo_profile(page=""):
+	"""Extracts the sector and industry from a Yahoo profile page: the values of the elements following the first
+	(sector, text of its first child) and second (industry, its own text) dt elements of the page.
+	Returns a dictionary with keys sector and industry, None for the fields not found"""
+	profile = {"sector": None, "industry": None}
+	first = _search(_DT, page)
+	if first is None:
+		return profile
+	profile["sector"] = _definition_value(page, first, 2)
+	second = _search(_DT, page, first.end())
+	if second is not None:
+		profile["industry"] = _definition_value(page, second, 1)
+	return profile
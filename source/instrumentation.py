@@ -0,0 +1,160 @@
+#This library contains the instrumentation of the hot paths of the training database creation.
+#It records wall time per stage, counters (requests, cache hits and misses, rows...), HTTP latency
+#histograms and bytes per host and peak memory, and writes them at the end of each run as a json
+#report so the stage limiting throughput can be identified and runs can be compared.
+
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+import configuration as config
+
+#Upper bounds in milliseconds of the buckets of the HTTP latency histograms (the last bucket has no bound)
+LATENCY_BUCKETS_MS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+_lock = threading.Lock()
+_started = time.perf_counter()
+_stages = {}
+_counters = {}
+_hosts = {}
+
+
+def reset():
+	"""Discards all the recorded measures. Called at the start of every run"""
+	global _started
+	with _lock:
+		_started = time.perf_counter()
+		_stages.clear()
+		_counters.clear()
+		_hosts.clear()
+
+
+@contextmanager
+def stage(name):
+	"""Context manager that records the wall time of a stage. Stages can be nested, each one records its inclusive time"""
+	start = time.perf_counter()
+	try:
+		yield
+	finally:
+		elapsed = time.perf_counter() - start
+		with _lock:
+			measure = _stages.setdefault(name, {"calls": 0, "seconds": 0.0, "max_seconds": 0.0})
+			measure["calls"] += 1
+			measure["seconds"] += elapsed
+			measure["max_seconds"] = max(measure["max_seconds"], elapsed)
+
+
+def timed(name):
+	"""Decorator that records the wall time of every call of the decorated function as the stage name"""
+	def decorator(function):
+		@functools.wraps(function)
+		def wrapper(*args, **kwargs):
+			with stage(name):
+				return function(*args, **kwargs)
+		return wrapper
+	return decorator
+
+
+def count(name, value=1):
+	"""Adds value to the counter name"""
+	with _lock:
+		_counters[name] = _counters.get(name, 0) + value
+
+
+def record_request(host, seconds, size, status_code):
+	"""Records an HTTP request to host: latency in seconds, bytes received and status code"""
+	milliseconds = seconds * 1000
+	bucket = next((position for position, bound in enumerate(LATENCY_BUCKETS_MS) if milliseconds <= bound), len(LATENCY_BUCKETS_MS))
+	with _lock:
+		measure = _hosts.setdefault(host, {"requests": 0, "bytes": 0, "seconds": 0.0, "max_ms": 0.0,
+			"status": {}, "latency_histogram": [0] * (len(LATENCY_BUCKETS_MS) + 1)})
+		measure["requests"] += 1
+		measure["bytes"] += size
+		measure["seconds"] += seconds
+		measure["max_ms"] = max(measure["max_ms"], milliseconds)
+		measure["status"][str(status_code)] = measure["status"].get(str(status_code), 0) + 1
+		measure["latency_histogram"][bucket] += 1
+
+
+def add_bytes(host, size):
+	"""Adds bytes received from host that were not known when the request was recorded (streamed bodies without Content-Length)"""
+	with _lock:
+		if host in _hosts:
+			_hosts[host]["bytes"] += size
+
+
+def _windows_peak_memory():
+	"""Returns the peak working set of the process in bytes from GetProcessMemoryInfo (Windows) or None if it cannot be obtained"""
+	import ctypes
+	from ctypes import wintypes
+
+	class ProcessMemoryCounters(ctypes.Structure):
+		_fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD), ("PeakWorkingSetSize", ctypes.c_size_t),
+			("WorkingSetSize", ctypes.c_size_t), ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+			("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+			("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+	try:
+		get_current_process = ctypes.windll.kernel32.GetCurrentProcess
+		get_current_process.restype = wintypes.HANDLE
+		get_memory_info = ctypes.windll.psapi.GetProcessMemoryInfo
+		get_memory_info.argtypes = [wintypes.HANDLE, ctypes.POINTER(ProcessMemoryCounters), wintypes.DWORD]
+		get_memory_info.restype = wintypes.BOOL
+		counters = ProcessMemoryCounters()
+		counters.cb = ctypes.sizeof(counters)
+		if not get_memory_info(get_current_process(), ctypes.byref(counters), counters.cb):
+			return None
+		return counters.PeakWorkingSetSize
+	except (AttributeError, OSError):
+		return None
+
+
+def peak_memory_mb():
+	"""Returns the peak resident memory of the process in MB or None if it cannot be obtained in this platform.
+	It is read from getrusage on Linux and macOS and from the peak working set on Windows"""
+	try:
+		import resource
+	except ImportError:
+		peak = _windows_peak_memory() if sys.platform == "win32" else None
+		return peak / 1024 / 1024 if peak is not None else None
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	#ru_maxrss is reported in bytes on macOS and in KB on Linux
+	return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def report():
+	"""Returns the measures recorded since the last reset as a dictionary"""
+	with _lock:
+		hosts = json.loads(json.dumps(_hosts))
+		for measure in hosts.values():
+			measure["mean_ms"] = measure["seconds"] * 1000 / measure["requests"] if measure["requests"] else 0.0
+		return {
+			"created": datetime.now().isoformat(timespec="seconds"),
+			"wall_seconds": time.perf_counter() - _started,
+			"peak_memory_mb": peak_memory_mb(),
+			"stages": json.loads(json.dumps(_stages)),
+			"counters": dict(_counters),
+			"hosts": hosts,
+			"latency_buckets_ms": LATENCY_BUCKETS_MS,
+		}
+
+
+def write_report(path=None):
+	"""Writes the report of the run into path (by default a perf_<timestamp>.json file in the log folder).
+	Returns the report"""
+	run_report = report()
+	path = path or config.LOG_PATH + "perf_" + datetime.now().strftime("%Y%m%d_%H%M%S") + ".json"
+	try:
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		with open(path, 'w') as f:
+			json.dump(run_report, f, indent=1)
+	except Exception as err:
+		logging.warning("instrumentation.write_report: Performance report cannot be written into %s - %s", path, err)
+	else:
+		logging.info("instrumentation.write_report: Performance report written into %s", path)
+	return run_report
@@ -0,0 +1,98 @@
+#This library contains the json file store shared by the manifest, the caches and the dataset dimension table.
+#The content is kept in memory and written to disk in batches (every config.JSON_STORE_FLUSH_EVERY changes or
+#config.JSON_STORE_FLUSH_SECONDS seconds) and when the store is flushed at the end of a run, instead of on
+#every change. Files are replaced atomically so a crash cannot leave them half written; at most the last
+#batch of changes is lost. When a batch is complete all the stores are written together, so the files stay
+#consistent with each other (a company is never recorded as built in the manifest without its attributes
+#in the dimension table).
+
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import configuration as config
+
+#Stores created in this process, in creation order, written together when a batch is complete and when the process exits
+_stores = []
+_stores_lock = threading.Lock()
+
+
+class JsonStore:
+	"""Json file loaded in memory the first time it is accessed and written to disk in batches.
+	path is the file or a function returning it (evaluated when the file is loaded, so the configuration can change between runs)
+	and default a function returning the content of a new store.
+	Access and change the content returned by data() holding lock, and register every change with changed() once lock is released
+	(a complete batch writes the other stores too)"""
+
+	def __init__(self, path, default=dict):
+		self._path = path
+		self._default = default
+		self._data = None
+		self._loaded_path = None
+		self._pending = 0
+		self._written = 0.0
+		self.lock = threading.RLock()
+		with _stores_lock:
+			_stores.append(self)
+
+	def data(self):
+		"""Returns the in-memory content, reading it from disk the first time"""
+		with self.lock:
+			if self._data is None:
+				self._loaded_path = self._path() if callable(self._path) else self._path
+				self._data = self._default()
+				if os.path.isfile(self._loaded_path):
+					try:
+						with open(self._loaded_path, 'r') as f:
+							self._data = json.load(f)
+					except Exception as err:
+						logging.warning("jsonstore.data: File %s cannot be read, starting an empty one - %s", self._loaded_path, err)
+				self._pending = 0
+				self._written = time.time()
+			return self._data
+
+	def changed(self, flush=False):
+		"""Registers a change of the content. The file is written if flush is True and all the stores are written if the batch is complete"""
+		with self.lock:
+			self._pending += 1
+			complete = self._pending >= config.JSON_STORE_FLUSH_EVERY or time.time() - self._written >= config.JSON_STORE_FLUSH_SECONDS
+		#Written outside the lock, so two stores completing a batch at the same time cannot wait for each other
+		if flush:
+			self.flush()
+		elif complete:
+			flush_all()
+
+	def flush(self):
+		"""Writes the content to disk if it has changes not written yet"""
+		with self.lock:
+			if self._data is None or not self._pending:
+				return
+			tmp_path = self._loaded_path + ".tmp"
+			try:
+				if os.path.dirname(self._loaded_path):
+					os.makedirs(os.path.dirname(self._loaded_path), exist_ok=True)
+				with open(tmp_path, 'w') as f:
+					json.dump(self._data, f)
+				os.replace(tmp_path, self._loaded_path)
+			except Exception as err:
+				logging.warning("jsonstore.flush: File %s cannot be written - %s", self._loaded_path, err)
+			else:
+				self._pending = 0
+			self._written = time.time()
+
+	def reload(self):
+		"""Writes the pending changes and discards the in-memory content, so the file is read again on the next access"""
+		with self.lock:
+			self.flush()
+			self._data = None
+
+
+@atexit.register
+def flush_all():
+	"""Writes the pending changes of all the stores of the process"""
+	with _stores_lock:
+		stores = list(_stores)
+	for store in stores:
+		store.flush()
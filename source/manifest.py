@@ -0,0 +1,63 @@
+#This library contains the build manifest of the training database. For every ticker it keeps
+#the validators of the last download (ETag, Last-Modified), the hash of the downloaded content
+#and the time and source content hash of the last successful build, so unchanged companies are not
+#processed again and an interrupted build can be resumed.
+
+import logging
+import time
+import configuration as config
+import jsonstore
+
+#Manifest: {"run": {"started": timestamp, "completed": bool}, "tickers": {ticker: {field: value}}}
+_store = jsonstore.JsonStore(lambda: config.EDGAR_MANIFEST_FILE, lambda: {"run": {}, "tickers": {}})
+
+
+def get_entry(ticker=""):
+	"""Returns a copy of the manifest entry of the provided ticker (empty dictionary if the ticker is unknown)"""
+	with _store.lock:
+		return dict(_store.data()["tickers"].get(ticker, {}))
+
+
+def update_entry(ticker, **fields):
+	"""Updates the provided fields of the manifest entry of the ticker. The manifest is written in batches (see flush)"""
+	with _store.lock:
+		_store.data()["tickers"].setdefault(ticker, {}).update(fields)
+	_store.changed()
+
+
+def start_run(resume=True):
+	"""Registers the start of a training database build.
+	If resume is True and the previous build was not completed, the previous build is continued.
+	Returns the start time of the build"""
+	with _store.lock:
+		run = _store.data()["run"]
+		if resume and run and not run.get("completed", True):
+			logging.info("manifest.start_run: Resuming build started at %s", time.ctime(run['started']))
+			return run["started"]
+		run.clear()
+		run.update({"started": time.time(), "completed": False})
+		started = run["started"]
+	_store.changed(flush=True)
+	return started
+
+
+def complete_run():
+	"""Registers that the current training database build has been completed"""
+	with _store.lock:
+		_store.data()["run"]["completed"] = True
+	_store.changed(flush=True)
+
+
+def built_since(ticker, timestamp):
+	"""Checks if the provided ticker has been built successfully after timestamp"""
+	return get_entry(ticker).get("built", 0) >= timestamp
+
+
+def flush():
+	"""Writes the manifest updates not written yet into config.EDGAR_MANIFEST_FILE"""
+	_store.flush()
+
+
+def reload():
+	"""Writes the pending updates and discards the in-memory manifest, so it is read again from config.EDGAR_MANIFEST_FILE on the next access"""
+	_store.reload()
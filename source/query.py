@@ -0,0 +1,247 @@
+#This library contains an indexed query API over the training dataset. The query index stores every
+#column as a flat binary file that is memory mapped when the index is opened, with the rows sorted
+#by ticker, concept and fiscal year, so lookups are binary searches on small slices instead of full
+#scans of the table.
+
+import json
+import logging
+import os
+import threading
+import numpy as np
+import pandas as pd
+import configuration as config
+import cikindex
+import dataset
+
+#Fixed width types of the non text columns. The rest of the columns are stored as int32 dictionary codes
+NUMERIC_COLUMNS = {'val': 'float64', 'fy': 'int32', 'end': 'datetime64[D]', 'filed': 'datetime64[D]'}
+#Value stored for missing fiscal years
+FY_MISSING = -1
+META_FILE = "meta.json"
+CONCEPT_ROWS_FILE = "concept_rows.bin"
+
+#Index opened in memory: {"meta": dict, "columns": {column: memmap}, "concept_rows": memmap}
+_index = None
+_lock = threading.Lock()
+#Stamp of the last changed dataset reported, so the warning is logged once per dataset build
+_stale_stamp = None
+
+
+def _column_file(column):
+	"""Returns the path of the binary file of the provided column"""
+	return config.EDGAR_QUERY_INDEX_PATH + column + ".bin"
+
+
+def _to_binary(company_table, column, categories):
+	"""Converts a column of a company table to the binary representation stored in the index.
+	Text columns are converted to the codes of the categories dictionary {value: code}, which is extended with the new values"""
+	if column == 'fy':
+		return company_table[column].fillna(FY_MISSING).to_numpy(dtype='int32')
+	if column in NUMERIC_COLUMNS:
+		return company_table[column].to_numpy(dtype=NUMERIC_COLUMNS[column])
+	local_codes, uniques = pd.factorize(company_table[column])
+	mapping = np.empty(len(uniques) + 1, dtype='int32')
+	for position, value in enumerate(uniques):
+		mapping[position] = categories.setdefault(value, len(categories))
+	if (local_codes < 0).any():
+		#Missing values (code -1) are mapped to the last element of the mapping
+		mapping[-1] = categories.setdefault(None, len(categories))
+	return mapping[local_codes]
+
+
+def build_query_index():
+	"""Creates the query index from the training dataset, streaming one partition at a time.
+	The stamp of the dataset indexed is stored with the index, so queries can detect that the dataset has been built again.
+	Returns the number of rows indexed"""
+	global _index
+	logging.info("query.build_query_index: Building query index into %s", config.EDGAR_QUERY_INDEX_PATH)
+	os.makedirs(config.EDGAR_QUERY_INDEX_PATH, exist_ok=True)
+	with _lock:
+		_index = None
+	stamp = dataset.dataset_stamp()
+	columns = None
+	categories = {}
+	files = {}
+	tickers = {}
+	rows = 0
+	try:
+		for ticker, company_table in dataset.iter_partitions():
+			if columns is None:
+				columns = list(company_table.columns)
+				categories = {column: {} for column in columns if column not in NUMERIC_COLUMNS}
+				files = {column: open(_column_file(column), 'wb') for column in columns}
+			company_table = company_table.reset_index(drop=True)
+			concept_codes = _to_binary(company_table, 'concept', categories['concept'])
+			fy = _to_binary(company_table, 'fy', None)
+			order = np.lexsort((fy, concept_codes))
+			for column in columns:
+				if column == 'concept':
+					values = concept_codes
+				elif column == 'fy':
+					values = fy
+				else:
+					values = _to_binary(company_table, column, categories.get(column))
+				values[order].tofile(files[column])
+			tickers[ticker] = [rows, rows + len(company_table)]
+			rows += len(company_table)
+	finally:
+		for f in files.values():
+			f.close()
+	if columns is None:
+		logging.warning("query.build_query_index: Training dataset is empty, query index not created")
+		return 0
+	#Secondary index: row positions of every concept, for lookups of a concept across all the tickers
+	concept_codes = np.fromfile(_column_file('concept'), dtype='int32')
+	concept_rows = np.argsort(concept_codes, kind='stable').astype('int64')
+	concept_offsets = np.searchsorted(concept_codes[concept_rows], np.arange(len(categories['concept']) + 1))
+	concept_rows.tofile(config.EDGAR_QUERY_INDEX_PATH + CONCEPT_ROWS_FILE)
+	meta = {
+		"rows": rows,
+		"columns": columns,
+		"categories": {column: list(values) for column, values in categories.items()},
+		"tickers": tickers,
+		"concept_offsets": concept_offsets.tolist(),
+		"dataset_stamp": stamp,
+	}
+	with open(config.EDGAR_QUERY_INDEX_PATH + META_FILE, 'w') as f:
+		json.dump(meta, f)
+	logging.info("query.build_query_index: Query index with %s rows of %s tickers created", rows, len(tickers))
+	return rows
+
+
+def _open():
+	"""Returns the query index, memory mapping it the first time it is requested. Data is read from disk only when accessed.
+	A warning is logged (once per dataset build) if the training dataset has been built again after the index was created"""
+	global _index, _stale_stamp
+	with _lock:
+		if _index is None:
+			with open(config.EDGAR_QUERY_INDEX_PATH + META_FILE, 'r') as f:
+				meta = json.load(f)
+			meta["concept_codes"] = {concept: code for code, concept in enumerate(meta["categories"]["concept"])}
+			meta["category_dtypes"] = {}
+			meta["category_codes"] = {}
+			for column, values in meta["categories"].items():
+				#Missing values (None) are not a category: their code is mapped to -1
+				valid = [value for value in values if value is not None]
+				positions = {value: position for position, value in enumerate(valid)}
+				meta["category_dtypes"][column] = pd.CategoricalDtype(valid)
+				meta["category_codes"][column] = np.array([positions.get(value, -1) for value in values], dtype='int32')
+			meta["cik_tickers"] = {cikindex.resolve_cik(ticker): ticker for ticker in meta["tickers"]}
+			mapped = {}
+			for column in meta["columns"]:
+				dtype = NUMERIC_COLUMNS.get(column, 'int32')
+				mapped[column] = np.memmap(_column_file(column), dtype=dtype, mode='r', shape=(meta["rows"],)) if meta["rows"] else np.empty(0, dtype=dtype)
+			concept_rows = np.memmap(config.EDGAR_QUERY_INDEX_PATH + CONCEPT_ROWS_FILE, dtype='int64', mode='r', shape=(meta["rows"],))
+			_index = {"meta": meta, "columns": mapped, "concept_rows": concept_rows}
+			logging.info("query._open: Query index with %s rows opened", meta['rows'])
+		stamp = dataset.dataset_stamp()
+		if stamp != _index["meta"].get("dataset_stamp") and stamp != _stale_stamp:
+			_stale_stamp = stamp
+			logging.warning("query._open: Training dataset changed after the query index was created, queries return the previous facts until it is created again (sarai.py query --build-index)")
+		return _index
+
+
+def _rows_to_table(index, rows, columns=None):
+	"""Creates a table with the provided row positions of the index (all the columns or only the provided ones).
+	Text columns are returned as categoricals"""
+	meta = index["meta"]
+	columns = columns or meta["columns"]
+	table = {}
+	for column in columns:
+		values = np.asarray(index["columns"][column][rows])
+		if column == 'fy':
+			table[column] = pd.array(np.where(values == FY_MISSING, None, values), dtype="Int32")
+		elif column in NUMERIC_COLUMNS:
+			table[column] = values
+		else:
+			table[column] = pd.Categorical.from_codes(meta["category_codes"][column][values], dtype=meta["category_dtypes"][column])
+	return pd.DataFrame(table, columns=columns)
+
+
+def _ticker_rows(index, ticker, concept=None, fy_from=None, fy_to=None):
+	"""Returns the row positions of a ticker, optionally limited to a concept and a fiscal year range, using binary searches"""
+	meta = index["meta"]
+	if ticker not in meta["tickers"]:
+		return np.empty(0, dtype='int64')
+	start, end = meta["tickers"][ticker]
+	if concept is not None:
+		code = meta["concept_codes"].get(concept)
+		if code is None:
+			return np.empty(0, dtype='int64')
+		#Search values must have the dtype of the column, otherwise numpy converts the whole slice before searching
+		concept_codes = index["columns"]['concept'][start:end]
+		code = np.int32(code)
+		start, end = start + int(np.searchsorted(concept_codes, code, 'left')), start + int(np.searchsorted(concept_codes, code, 'right'))
+		if fy_from is not None or fy_to is not None:
+			fy = index["columns"]['fy'][start:end]
+			#Missing fiscal years (FY_MISSING) are sorted first and never match a fiscal year filter
+			first = int(np.searchsorted(fy, np.int32(fy_from if fy_from is not None else FY_MISSING + 1), 'left'))
+			last = int(np.searchsorted(fy, np.int32(fy_to), 'right')) if fy_to is not None else end - start
+			start, end = start + first, start + last
+		return np.arange(start, end, dtype='int64')
+	rows = np.arange(start, end, dtype='int64')
+	if fy_from is not None or fy_to is not None:
+		fy = index["columns"]['fy'][start:end]
+		mask = fy != FY_MISSING
+		if fy_from is not None:
+			mask &= fy >= fy_from
+		if fy_to is not None:
+			mask &= fy <= fy_to
+		rows = rows[mask]
+	return rows
+
+
+def _concept_rows(index, concept, fy_from=None, fy_to=None):
+	"""Returns the row positions of a concept across all the tickers, optionally limited to a fiscal year range"""
+	meta = index["meta"]
+	code = meta["concept_codes"].get(concept)
+	if code is None:
+		return np.empty(0, dtype='int64')
+	rows = np.asarray(index["concept_rows"][meta["concept_offsets"][code]:meta["concept_offsets"][code + 1]])
+	if fy_from is not None or fy_to is not None:
+		fy = index["columns"]['fy'][rows]
+		mask = fy != FY_MISSING
+		if fy_from is not None:
+			mask &= fy >= fy_from
+		if fy_to is not None:
+			mask &= fy <= fy_to
+		rows = rows[mask]
+	return rows
+
+
+def get_facts(ticker=None, cik=None, concept=None, fy=None, fy_from=None, fy_to=None, columns=None):
+	"""Returns the facts of a company (by ticker or CIK), optionally limited to a concept and to a fiscal year or fiscal year range.
+	If no company is provided, the facts of the concept for all the companies are returned. columns limits the columns returned.
+	Returns the facts as a pandas dataframe (empty if nothing matches)"""
+	return get_facts_batch([ticker] if ticker else None, [concept] if concept else None, fy, fy_from, fy_to, [cik] if cik else None, columns)
+
+
+def get_facts_batch(tickers=None, concepts=None, fy=None, fy_from=None, fy_to=None, ciks=None, columns=None):
+	"""Returns in a single table the facts of many companies (tickers and/or CIKs) and/or many concepts, optionally limited to a
+	fiscal year or fiscal year range. Rows are returned grouped by company and concept, in the order requested, and a company
+	requested twice (e.g. by ticker and by CIK) is returned once.
+	Returns the facts as a pandas dataframe (empty if nothing matches, also if none of the requested companies is indexed)"""
+	index = _open()
+	if fy is not None:
+		fy_from, fy_to = fy, fy
+	tickers = list(tickers or [])
+	for cik in ciks or []:
+		ticker = index["meta"]["cik_tickers"].get(cikindex.normalize_cik(cik))
+		if ticker:
+			tickers.append(ticker)
+		else:
+			logging.warning("query.get_facts_batch: CIK %s not found in the query index", cik)
+	tickers = list(dict.fromkeys(tickers))
+	if tickers or ciks:
+		pieces = [_ticker_rows(index, ticker, concept, fy_from, fy_to) for ticker in tickers for concept in (concepts or [None])]
+	else:
+		pieces = [_concept_rows(index, concept, fy_from, fy_to) for concept in (concepts or [])]
+	rows = np.concatenate(pieces) if pieces else np.empty(0, dtype='int64')
+	return _rows_to_table(index, rows, columns)
+
+
+def close_index():
+	"""Closes the query index, so it is opened again on the next query (needed after rebuilding it)"""
+	global _index
+	with _lock:
+		_index = None
@@ -0,0 +1,38 @@
+#This library contains the rate limiters shared by all the modules that connect
+#to external websites, so the request rate stays under each site's limits.
+
+import threading
+import time
+import configuration as config
+
+
+class TokenBucket:
+	"""Thread safe token bucket. Every request takes one token and tokens are
+	refilled at a constant rate, allowing bursts up to the bucket capacity.
+	With the default capacity of one token requests are evenly spaced, so no
+	window of one second ever sees more than rate requests"""
+
+	def __init__(self, rate, capacity=1):
+		self.rate = float(rate)
+		self.capacity = float(capacity)
+		self.tokens = self.capacity
+		self.last_refill = time.monotonic()
+		self.lock = threading.Lock()
+
+	def acquire(self):
+		"""Blocks until a token is available and takes it"""
+		while True:
+			with self.lock:
+				now = time.monotonic()
+				self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+				self.last_refill = now
+				if self.tokens >= 1:
+					self.tokens -= 1
+					return
+				wait = (1 - self.tokens) / self.rate
+			time.sleep(wait)
+
+
+#Global limiters: one per external site, shared by all the worker threads
+EDGAR = TokenBucket(config.EDGAR_MAX_REQUESTS_PER_SECOND)
+YAHOO = TokenBucket(config.YAHOO_MAX_REQUESTS_PER_SECOND)
@@ -0,0 +1,154 @@
+#This library contains the raw data store, where every version of the downloaded company facts and of the
+#training table is kept. Files are stored compressed (zstd if the zstandard package is installed, gzip
+#otherwise) and addressed by the sha256 of their content, so identical versions are stored only once.
+#A small manifest per name (ticker or table) lists the versions stored by date, and versions are read as
+#lazily decompressed streams.
+
+import datetime
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import configuration as config
+import instrumentation
+
+#zstd is used to compress new objects when zstandard is installed, gzip otherwise. Both can always be read if installed
+try:
+	import zstandard
+	CODEC = "zst"
+except ImportError:
+	zstandard = None
+	CODEC = "gz"
+
+CODECS = ["zst", "gz"]
+ZSTD_LEVEL = 3
+GZIP_LEVEL = 6
+#Bytes read at a time from the files stored
+CHUNK_SIZE = 1024 * 1024
+_lock = threading.Lock()
+
+
+def _object_path(sha256, codec=CODEC):
+	"""Returns the path of the object with the provided content hash and codec"""
+	return os.path.join(config.RAW_STORE_PATH, "objects", sha256[:2], sha256 + "." + codec)
+
+
+def _manifest_path(name):
+	"""Returns the path of the manifest with the versions of the provided name"""
+	return os.path.join(config.RAW_STORE_PATH, "manifests", name + ".json")
+
+
+def _find_object(sha256):
+	"""Returns the path of the stored object with the provided content hash or None if it is not stored"""
+	for codec in CODECS:
+		path = _object_path(sha256, codec)
+		if os.path.isfile(path):
+			return path
+	return None
+
+
+def contains(sha256=""):
+	"""Checks if an object with the provided content hash is stored"""
+	return bool(sha256) and _find_object(sha256) is not None
+
+
+def versions(name=""):
+	"""Returns the versions stored for the provided name, oldest first: list of dictionaries with date (YYYYMMDD), time,
+	sha256, size (bytes of the content) and stored_size (bytes of the compressed object)"""
+	path = _manifest_path(name)
+	if not os.path.isfile(path):
+		return []
+	with open(path, 'r') as f:
+		return json.load(f)["versions"]
+
+
+def _compressed_writer(f):
+	"""Returns a writer that compresses with CODEC into the binary file f"""
+	if CODEC == "zst":
+		return zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(f, closefd=False)
+	return gzip.GzipFile(fileobj=f, mode='wb', compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _store_object(path):
+	"""Compresses the file path into the store, hashing it in the same pass. Nothing is written if the content is already stored.
+	Returns (sha256, size of the content)"""
+	objects_path = os.path.join(config.RAW_STORE_PATH, "objects")
+	os.makedirs(objects_path, exist_ok=True)
+	content_hash = hashlib.sha256()
+	size = 0
+	descriptor, tmp_path = tempfile.mkstemp(dir=objects_path, suffix=".tmp")
+	try:
+		with os.fdopen(descriptor, 'wb') as f:
+			with _compressed_writer(f) as writer, open(path, 'rb') as source:
+				for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+					content_hash.update(chunk)
+					writer.write(chunk)
+					size += len(chunk)
+		sha256 = content_hash.hexdigest()
+		if contains(sha256):
+			os.remove(tmp_path)
+		else:
+			os.makedirs(os.path.dirname(_object_path(sha256)), exist_ok=True)
+			os.replace(tmp_path, _object_path(sha256))
+	except BaseException:
+		if os.path.isfile(tmp_path):
+			os.remove(tmp_path)
+		raise
+	return sha256, size
+
+
+@instrumentation.timed("rawstore.put_file")
+def put_file(name, path, sha256=None):
+	"""Stores the content of the file path as the version of today of name (ticker or table name).
+	If the sha256 of the content is provided and it is already stored, the file is not read again.
+	Returns the sha256 of the content"""
+	if sha256 and contains(sha256):
+		size = os.path.getsize(path)
+		instrumentation.count("rawstore.deduplicated")
+	else:
+		sha256, size = _store_object(path)
+		instrumentation.count("rawstore.stored")
+	version = {"date": datetime.date.today().strftime("%Y%m%d"), "time": time.time(), "sha256": sha256, "size": size,
+		"stored_size": os.path.getsize(_find_object(sha256))}
+	manifest_path = _manifest_path(name)
+	with _lock:
+		stored_versions = [old for old in versions(name) if old["date"] != version["date"]] + [version]
+		os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+		with open(manifest_path + ".tmp", 'w') as f:
+			json.dump({"name": name, "versions": stored_versions}, f, indent=1)
+		os.replace(manifest_path + ".tmp", manifest_path)
+	logging.info("rawstore.put_file: Version %s of %s stored (%s bytes, %s compressed)", version['date'], name, size, version['stored_size'])
+	return sha256
+
+
+def open_object(sha256):
+	"""Opens the stored object with the provided content hash as a binary stream, decompressed as it is read.
+	Raises FileNotFoundError if it is not stored"""
+	path = _find_object(sha256)
+	if path is None:
+		raise FileNotFoundError(f"Object {sha256} not found in {config.RAW_STORE_PATH}")
+	if path.endswith(".zst"):
+		if zstandard is None:
+			raise RuntimeError(f"zstandard is not installed, object {sha256} cannot be read")
+		return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+	return gzip.open(path, 'rb')
+
+
+def open_version(name="", date=None):
+	"""Opens the latest version of name stored on or before date (YYYYMMDD, today if not provided) as a binary stream,
+	decompressed as it is read. Raises FileNotFoundError if there is no such version"""
+	date = date or datetime.date.today().strftime("%Y%m%d")
+	candidates = [version for version in versions(name) if version["date"] <= date]
+	if not candidates:
+		raise FileNotFoundError(f"No version of {name} stored on or before {date}")
+	return open_object(candidates[-1]["sha256"])
+
+
+def read_version(name="", date=None):
+	"""Returns the content of the latest version of name stored on or before date (see open_version)"""
+	with open_version(name, date) as f:
+		return f.read()
@@ -0,0 +1,253 @@
+#This library contains a local stand-in of the EDGAR and Yahoo websites used by the benchmarks.
+#It serves the company facts json (recorded or synthetic), the EDGAR browse page and the Yahoo profile
+#page of a list of synthetic companies, with configurable latency and error injection, so the whole
+#training database creation can be measured without connection to the real sites.
+#The server runs in its own process, so it does not compete with the measured pipeline for the GIL.
+
+import email.utils
+import hashlib
+import json
+import logging
+import multiprocessing
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import configuration as config
+
+#(sector, industry, SIC, activity) assigned in turn to the synthetic companies
+PROFILES = [
+	("Technology", "Consumer Electronics", "3571", "ELECTRONIC COMPUTERS"),
+	("Technology", "Software - Infrastructure", "7372", "SERVICES-PREPACKAGED SOFTWARE"),
+	("Healthcare", "Drug Manufacturers - General", "2834", "PHARMACEUTICAL PREPARATIONS"),
+	("Financial Services", "Banks - Diversified", "6021", "NATIONAL COMMERCIAL BANKS"),
+	("Energy", "Oil & Gas Integrated", "2911", "PETROLEUM REFINING"),
+	("Consumer Cyclical", "Internet Retail", "5961", "RETAIL-CATALOG & MAIL-ORDER HOUSES"),
+	("Industrials", "Aerospace & Defense", "3721", "AIRCRAFT"),
+	("Communication Services", "Internet Content & Information", "7370", "SERVICES-COMPUTER PROGRAMMING, DATA PROCESSING, ETC."),
+]
+
+#Last-Modified date reported for all the company facts
+LAST_MODIFIED = email.utils.formatdate(time.mktime((2024, 1, 2, 0, 0, 0, 0, 0, 0)), usegmt=True)
+
+
+def synthetic_companies(count=10, first_cik=9000000001):
+	"""Returns a list of count synthetic companies: dictionaries with ticker, cik (10 digits), name, sector, industry, sic and activity"""
+	companies = []
+	for position in range(count):
+		sector, industry, sic, activity = PROFILES[position % len(PROFILES)]
+		companies.append({
+			"ticker": f"SYN{position:05d}",
+			"cik": str(first_cik + position).zfill(10),
+			"name": f"Synthetic Company {position} Inc.",
+			"sector": sector,
+			"industry": industry,
+			"sic": sic,
+			"activity": activity,
+		})
+	return companies
+
+
+def synthetic_company_facts(concepts=100, facts_per_concept=20, seed=0):
+	"""Returns the "facts" section of a synthetic company facts json with the layout of the EDGAR API: concepts us-gaap concepts
+	with facts_per_concept USD facts each, split into annual (10-K) and quarterly (10-Q) facts of consecutive fiscal years"""
+	rng = random.Random(seed)
+	us_gaap = {}
+	for concept_number in range(concepts):
+		facts = []
+		for fact_number in range(facts_per_concept):
+			fy = 2024 - fact_number // 5
+			quarter = fact_number % 5
+			annual = quarter == 0
+			facts.append({
+				"end": f"{fy}-12-31" if annual else f"{fy}-{quarter * 3:02d}-28",
+				"val": rng.randint(-10 ** 9, 10 ** 11),
+				"accn": f"0009000001-{fy % 100 + 1:02d}-{fact_number:06d}",
+				"fy": fy,
+				"fp": "FY" if annual else f"Q{quarter}",
+				"form": "10-K" if annual else "10-Q",
+				"filed": f"{fy + 1}-02-01" if annual else f"{fy + quarter // 4}-{quarter * 3 % 12 + 1:02d}-25",
+				"frame": f"CY{fy}" if annual else f"CY{fy}Q{quarter}I",
+			})
+		us_gaap[f"SyntheticConcept{concept_number:04d}"] = {
+			"label": f"Synthetic Concept {concept_number}",
+			"description": "Synthetic financial concept generated for benchmarks.",
+			"units": {"USD": facts},
+		}
+	return {"us-gaap": us_gaap}
+
+
+def browse_page(company, filings=40):
+	"""Returns the EDGAR browse page of a company, with the company information block and a table with filings rows"""
+	rows = "".join(
+		f'<tr><td nowrap="nowrap">10-Q</td><td nowrap="nowrap"><a href="/Archives/edgar/data/{int(company["cik"])}/{number:06d}-index.htm" '
+		f'id="documentsbutton">&nbsp;Documents</a></td><td class="small">Quarterly report [Sections 13 or 15(d)]<br />Acc-no: '
+		f'0009000001-24-{number:06d}&nbsp;(34 Act)&nbsp; Size: 6 MB</td><td>2024-01-{number % 28 + 1:02d}</td><td></td></tr>\n'
+		for number in range(filings))
+	return (
+		'<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Transitional//EN">\n<html><head><title>EDGAR Search Results</title></head><body>\n'
+		'<div id="contentDiv"><div id="filerDiv"><div class="companyInfo">\n'
+		f'<span class="companyName">{company["name"]} <acronym title="Central Index Key">CIK</acronym>#: '
+		f'<a href="/cgi-bin/browse-edgar?action=getcompany&amp;CIK={company["cik"]}&amp;owner=exclude&amp;count=40">'
+		f'{company["cik"]} (see all company filings)</a></span>\n'
+		f'<p class="identInfo"><acronym title="Standard Industrial Code">SIC</acronym>: '
+		f'<a href="/cgi-bin/browse-edgar?action=getcompany&amp;SIC={company["sic"]}&amp;owner=exclude&amp;count=40">{company["sic"]}</a> - '
+		f'{company["activity"].replace("&", "&amp;")}<br />State location: <a href="/cgi-bin/browse-edgar?action=getcompany&amp;State=CA">CA</a> | '
+		'State of Inc.: <strong>DE</strong> | Fiscal Year End: 1231</p>\n</div></div>\n'
+		'<div id="seriesDiv"><table class="tableFile2" summary="Results">\n'
+		'<tr><th>Filings</th><th>Format</th><th>Description</th><th>Filing Date</th><th>File/Film Number</th></tr>\n'
+		f'{rows}</table></div></div></body></html>\n')
+
+
+def browse_error_page():
+	"""Returns the EDGAR browse page answered for unknown companies"""
+	return f'<html><head><title>EDGAR Search Results</title></head><body><h1>{config.ERROR_MESSAGE1}.</h1></body></html>\n'
+
+
+def profile_page(company, padding=200000):
+	"""Returns the Yahoo profile page of a company. About padding characters of scripts and as many of navigation markup
+	are added to get the size and structure of the real pages"""
+	script = '<script type="application/json">' + ('{"data":"' + "x" * 990 + '"},') * (padding // 1000) + '</script>\n'
+	navigation = '<nav><ul>' + "".join(
+		f'<li class="item"><a href="/quote/SYM{number}/" title="Symbol {number}"><span class="symbol">SYM{number}</span>'
+		f'<span class="price">{number}.00</span></a></li>\n' for number in range(padding // 130)) + '</ul></nav>\n'
+	return (
+		f'<!DOCTYPE html><html lang="en-US"><head><title>{company["name"]} ({company["ticker"]}) Company Profile</title>\n{script}</head><body>\n'
+		f'{navigation}<section class="container"><h1>{company["name"]} ({company["ticker"]})</h1>\n'
+		'<div class="company-info"><dl class="company-stats">\n'
+		f'<div><dt>Sector: </dt><dd><a href="/sectors/{company["sector"].lower().replace(" ", "-")}/">{company["sector"]}</a></dd></div>\n'
+		f'<div><dt>Industry: </dt><dd>{company["industry"].replace("&", "&amp;")}</dd></div>\n'
+		'<div><dt>Full Time Employees: </dt><dd><strong>1,000</strong></dd></div>\n'
+		f'</dl></div></section>\n{script}</body></html>\n')
+
+
+def profile_error_page(ticker=""):
+	"""Returns the Yahoo page answered for unknown tickers"""
+	return f'<html><head><title>Yahoo Finance</title></head><body><h1>{config.ERROR_MESSAGE3} \'{ticker}\'</h1></body></html>\n'
+
+
+def _handler_class(companies, options):
+	"""Returns the request handler class serving the provided companies with the provided options"""
+	by_ticker = {company["ticker"]: company for company in companies}
+	by_cik = {company["cik"]: company for company in companies}
+	if options.get("facts_file"):
+		with open(options["facts_file"], 'r') as f:
+			facts = json.load(f)["facts"]
+	else:
+		facts = synthetic_company_facts(options.get("concepts", 100), options.get("facts_per_concept", 20), options.get("seed", 0))
+	#The facts are encoded once and only the company header changes between companies
+	facts_body = json.dumps(facts).encode()
+	etag_suffix = hashlib.sha256(facts_body).hexdigest()[:16]
+	rng = random.Random(options.get("seed", 0))
+	rng_lock = threading.Lock()
+
+	class ReplayHandler(BaseHTTPRequestHandler):
+		protocol_version = "HTTP/1.1"
+
+		def log_message(self, format, *args):
+			pass
+
+		def _send(self, status, body=b"", content_type="text/html; charset=utf-8", headers=None):
+			self.send_response(status)
+			self.send_header("Content-Type", content_type)
+			self.send_header("Content-Length", str(len(body)))
+			for name, value in (headers or {}).items():
+				self.send_header(name, value)
+			self.end_headers()
+			if body:
+				self.wfile.write(body)
+
+		def do_GET(self):
+			with rng_lock:
+				delay = options.get("latency", 0.0) + rng.uniform(0, options.get("jitter", 0.0))
+				failed = rng.random() < options.get("error_rate", 0.0)
+			if delay:
+				time.sleep(delay)
+			if failed:
+				self._send(503, b"Service Unavailable", "text/plain", {"Retry-After": "0"})
+				return
+			url = urlsplit(self.path)
+			if url.path.startswith("/api/xbrl/companyfacts/CIK") and url.path.endswith(".json"):
+				company = by_cik.get(url.path[len("/api/xbrl/companyfacts/CIK"):-len(".json")])
+				if company is None:
+					self._send(404, b'{"message": "Not Found"}', "application/json")
+					return
+				etag = f'"{company["cik"]}-{etag_suffix}"'
+				if self.headers.get("If-None-Match") == etag:
+					self._send(304, headers={"ETag": etag, "Last-Modified": LAST_MODIFIED})
+					return
+				body = b'{"cik": %d, "entityName": %s, "facts": %s}' % (int(company["cik"]), json.dumps(company["name"]).encode(), facts_body)
+				self._send(200, body, "application/json", {"ETag": etag, "Last-Modified": LAST_MODIFIED})
+			elif url.path == "/cgi-bin/browse-edgar":
+				key = parse_qs(url.query).get("CIK", [""])[0].strip().upper()
+				company = by_ticker.get(key) or by_cik.get(key.zfill(10))
+				page = browse_page(company, options.get("filings", 40)) if company else browse_error_page()
+				self._send(200, page.encode())
+			elif url.path.startswith("/quote/") and url.path.rstrip("/").endswith("/profile"):
+				ticker = url.path.split("/")[2]
+				company = by_ticker.get(ticker.upper())
+				page = profile_page(company, options.get("padding", 200000)) if company else profile_error_page(ticker)
+				self._send(200, page.encode())
+			else:
+				self._send(404, b"Not Found", "text/plain")
+
+	return ReplayHandler
+
+
+def _serve(companies, options, connection):
+	"""Runs the replay server until the process is terminated. The port is sent through connection once the server is listening"""
+	class Server(ThreadingHTTPServer):
+		daemon_threads = True
+		request_queue_size = 256
+
+	server = Server(("127.0.0.1", options.get("port", 0)), _handler_class(companies, options))
+	connection.send(server.server_port)
+	connection.close()
+	server.serve_forever()
+
+
+class ReplayServer:
+	"""Local stand-in of EDGAR and Yahoo serving the provided companies (see synthetic_companies).
+	Options: latency and jitter (seconds added to every response, jitter is uniform), error_rate (fraction of requests answered
+	with 503 and Retry-After: 0), facts_file (recorded company facts json served for every company, synthetic facts otherwise),
+	concepts and facts_per_concept (size of the synthetic facts), filings (rows of the browse page), padding (size of the
+	profile page) and seed. Use it as a context manager or call start and stop"""
+
+	def __init__(self, companies, **options):
+		self.companies = companies
+		self.options = options
+		self.process = None
+		self.base_url = None
+
+	def start(self):
+		"""Starts the server process and waits until it is listening. Returns the base URL of the server"""
+		receiver, sender = multiprocessing.Pipe(duplex=False)
+		self.process = multiprocessing.Process(target=_serve, args=(self.companies, self.options, sender), daemon=True)
+		self.process.start()
+		if not receiver.poll(60):
+			self.stop()
+			raise RuntimeError("Replay server did not start")
+		self.base_url = f"http://127.0.0.1:{receiver.recv()}"
+		logging.info("replayserver.start: Replay server with %s companies listening on %s", len(self.companies), self.base_url)
+		return self.base_url
+
+	def stop(self):
+		"""Stops the server process"""
+		if self.process is not None:
+			self.process.terminate()
+			self.process.join()
+			self.process = None
+
+	def configure(self):
+		"""Points the EDGAR and Yahoo URLs of the configuration to the server"""
+		config.companyFactsURL = self.base_url + "/api/xbrl/companyfacts/CIK{}.json"
+		config.BROWSE_URL = self.base_url + "/cgi-bin/browse-edgar?CIK={}&owner=exclude&action=getcompany&Find=Search"
+		config.PROFILE_URL = self.base_url + "/quote/{}/profile/"
+
+	def __enter__(self):
+		self.start()
+		return self
+
+	def __exit__(self, *exc_info):
+		self.stop()
@@ -0,0 +1,219 @@
+#This is the command line interface of sarAI: python sarai.py <command> [options].
+#Commands: build (creates the training database), refresh (updates it with the companies whose facts changed),
+#resolve-cik (resolves the CIK of tickers), query (reads facts from the query index) and features (builds the
+#feature matrix of the training dataset). build and refresh also
+#create again the query index if it exists, so queries never return the facts of a previous build.
+#Only the modules needed by the command are imported, inside the function of the command, so cheap commands
+#start without loading pandas or the networking modules.
+#Log records are put in a queue and formatted and written to the log file by a background thread, and
+#repeated INFO messages are sampled (see LOG_SAMPLING_FIRST and LOG_SAMPLING_RATE in configuration).
+
+import argparse
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from datetime import datetime
+import configuration as config
+
+LOG_FORMAT = "%(asctime)s - [%(levelname)s] - %(message)s"
+LOG_DATE_FORMAT = "%H:%M:%S"
+#Maximum number of message templates counted by the sampling filter before the counts are restarted
+SAMPLING_MAX_TEMPLATES = 10000
+
+
+class SamplingFilter(logging.Filter):
+	"""Lets through the first `first` records of every message template and then one of every `rate`.
+	Records are grouped by their template (the message before the arguments are merged), so the messages repeated per
+	company or per concept are sampled and the rest are written. Warnings and errors always pass"""
+
+	def __init__(self, first=config.LOG_SAMPLING_FIRST, rate=config.LOG_SAMPLING_RATE):
+		super().__init__()
+		self.first = first
+		self.rate = max(1, rate)
+		self._counts = {}
+		self._lock = threading.Lock()
+
+	def filter(self, record):
+		if record.levelno >= logging.WARNING:
+			return True
+		with self._lock:
+			if len(self._counts) >= SAMPLING_MAX_TEMPLATES:
+				self._counts.clear()
+			seen = self._counts.get(record.msg, 0)
+			self._counts[record.msg] = seen + 1
+		return seen < self.first or (seen - self.first) % self.rate == self.rate - 1
+
+
+class _LazyQueueHandler(logging.handlers.QueueHandler):
+	"""Queue handler that puts the records in the queue as they are, so the message is formatted by the listener thread
+	and not by the thread that logs. Records logged by a forked worker process, where the listener thread does not run,
+	are written directly to the log file"""
+
+	def __init__(self, records, log_file):
+		super().__init__(records)
+		self.log_file = log_file
+		self._pid = os.getpid()
+		self._file_handler = None
+
+	def prepare(self, record):
+		return record
+
+	def emit(self, record):
+		if os.getpid() == self._pid:
+			self.enqueue(record)
+			return
+		if self._file_handler is None:
+			self._file_handler = logging.FileHandler(self.log_file)
+			self._file_handler.setFormatter(logging.Formatter(LOG_FORMAT, LOG_DATE_FORMAT))
+		self._file_handler.handle(record)
+
+
+def setup_logging(level=logging.INFO, log_file=None):
+	"""Sets up the logging of the run: records of the provided level and above are sampled (SamplingFilter), put in a queue and
+	written to log_file (config.LOG_PATH + date + ".log" if not provided) by a background thread. Warnings and errors are also
+	printed to the console.
+	Returns the queue listener, which must be stopped at the end of the run to write the pending records"""
+	log_file = log_file or config.LOG_PATH + datetime.today().strftime('%Y-%m-%d') + ".log"
+	os.makedirs(os.path.dirname(log_file), exist_ok=True)
+	formatter = logging.Formatter(LOG_FORMAT, LOG_DATE_FORMAT)
+	file_handler = logging.FileHandler(log_file)
+	file_handler.setFormatter(formatter)
+	console_handler = logging.StreamHandler(sys.stderr)
+	console_handler.setLevel(logging.WARNING)
+	console_handler.setFormatter(formatter)
+	records = queue.SimpleQueue()
+	queue_handler = _LazyQueueHandler(records, log_file)
+	queue_handler.addFilter(SamplingFilter())
+	root = logging.getLogger()
+	for handler in root.handlers[:]:
+		root.removeHandler(handler)
+	root.addHandler(queue_handler)
+	root.setLevel(level)
+	listener = logging.handlers.QueueListener(records, file_handler, console_handler, respect_handler_level=True)
+	listener.start()
+	return listener
+
+
+def _update_query_index():
+	"""Creates again the query index, if it exists, after the training dataset has been built"""
+	import query
+	if os.path.isfile(config.EDGAR_QUERY_INDEX_PATH + query.META_FILE):
+		query.build_query_index()
+
+
+def _build(args):
+	"""Creates the training database from scratch"""
+	import edgar
+	if edgar.create_training_database(args.workers, incremental=False, resume=not args.no_resume, archive_path=args.archive):
+		_update_query_index()
+	return 0
+
+
+def _refresh(args):
+	"""Updates the training database, rebuilding only the companies whose facts changed since the previous run"""
+	import edgar
+	if edgar.create_training_database(args.workers, incremental=True, resume=not args.no_resume, archive_path=args.archive):
+		_update_query_index()
+	return 0
+
+
+def _resolve_cik(args):
+	"""Prints the CIK of every ticker, from the local CIK index or, with --online, from EDGAR if it is not indexed"""
+	import cikindex
+	result = 0
+	for ticker in args.tickers:
+		cik = cikindex.resolve_cik(ticker)
+		if not cik and args.online:
+			import edgar
+			cik = edgar.get_cik(ticker)
+		if not cik:
+			result = 1
+		print(f"{ticker}\t{cik or 'NOT FOUND'}")
+	return result
+
+
+def _query(args):
+	"""Prints the facts of a company and/or a concept read from the query index"""
+	import query
+	if args.build_index:
+		query.build_query_index()
+	if not args.ticker and not args.cik and not args.concept:
+		return 0
+	try:
+		facts = query.get_facts(args.ticker, args.cik, args.concept, args.fy, args.fy_from, args.fy_to, args.columns)
+	except FileNotFoundError:
+		print(f"Query index not found in {config.EDGAR_QUERY_INDEX_PATH}, create it with: sarai.py query --build-index", file=sys.stderr)
+		return 1
+	if args.csv:
+		facts.to_csv(sys.stdout, index=False)
+	else:
+		print(facts.to_string(index=False))
+	return 0
+
+
+def _features(args):
+	"""Builds the feature matrix of the training dataset (or of the provided tickers) and writes it in the format of the partitions"""
+	import dataset
+	import features
+	matrix = features.build_feature_matrix(args.tickers or None)
+	path = args.output or config.EDGAR_FEATURES_MATRIX_FILE + "." + dataset.PARTITION_FORMAT
+	os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+	if path.endswith(".parquet"):
+		matrix.to_parquet(path)
+	else:
+		matrix.to_csv(path)
+	print(f"Feature matrix with {matrix.shape[0]} rows and {matrix.shape[1]} concepts written to {path}")
+	return 0
+
+
+def _parser():
+	"""Returns the parser of the command line"""
+	parser = argparse.ArgumentParser(prog="sarai", description="sarAI training database of EDGAR financial facts")
+	parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"], help="minimum level of the log records written")
+	parser.add_argument("--log-file", help="log file (default: log folder, one file per day)")
+	commands = parser.add_subparsers(dest="command", required=True)
+	for name, function, help_text in [("build", _build, "create the training database of the INDEX companies"),
+			("refresh", _refresh, "update the training database with the companies whose facts changed")]:
+		command = commands.add_parser(name, help=help_text)
+		command.add_argument("--workers", type=int, default=config.TRAINING_WORKERS, help="companies processed in parallel")
+		command.add_argument("--no-resume", action="store_true", help="do not reuse the partitions of an interrupted run")
+		command.add_argument("--archive", nargs="?", const=config.COMPANYFACTS_ARCHIVE, help="read the facts from the companyfacts.zip archive instead of EDGAR")
+		command.set_defaults(function=function)
+	command = commands.add_parser("resolve-cik", help="print the CIK of tickers")
+	command.add_argument("tickers", nargs="+")
+	command.add_argument("--online", action="store_true", help="ask EDGAR for the tickers not found in the local CIK index")
+	command.set_defaults(function=_resolve_cik)
+	command = commands.add_parser("query", help="print facts from the query index")
+	command.add_argument("ticker", nargs="?")
+	command.add_argument("--cik")
+	command.add_argument("--concept")
+	command.add_argument("--fy", type=int, help="fiscal year")
+	command.add_argument("--from", dest="fy_from", type=int, help="first fiscal year")
+	command.add_argument("--to", dest="fy_to", type=int, help="last fiscal year")
+	command.add_argument("--columns", nargs="+", help="columns returned (all if not provided)")
+	command.add_argument("--csv", action="store_true", help="print the facts as csv")
+	command.add_argument("--build-index", action="store_true", help="create the query index from the training dataset first")
+	command.set_defaults(function=_query)
+	command = commands.add_parser("features", help="build the feature matrix of the training dataset")
+	command.add_argument("tickers", nargs="*", help="tickers included (all the dataset if not provided)")
+	command.add_argument("--output", help="file written, parquet or csv by extension (default: EDGAR_FEATURES_MATRIX_FILE)")
+	command.set_defaults(function=_features)
+	return parser
+
+
+def main(argv=None):
+	"""Runs the command of the command line. Returns the exit code"""
+	args = _parser().parse_args(argv)
+	listener = setup_logging(getattr(logging, args.log_level), args.log_file)
+	try:
+		return args.function(args)
+	finally:
+		listener.stop()
+
+
+#Guard needed by the worker processes of the archive mode
+if __name__ == "__main__":
+	sys.exit(main())
@@ -22,6 +22,8 @@ def add_ciks_to_tickers_file(file=""):
 def check_file(file=""):
     """Checks for each ticker in in the tickers file, if it is present in the proided CSV file with a financial concept"""
     df_financials = pd.read_csv(file)
+    #Row positions of every CIK, computed once instead of scanning the whole table for each ticker
+    cik_rows = df_financials.groupby('cik').indices
     tickers = open(TICKERS_FILE)
     for line in tickers.readlines():
         ticker = line.split(",")[0]
@@ -31,7 +33,7 @@ def check_file(file=""):
             except Exception as err:
                 print(f"CIK cannot be retrieved for {ticker}")
             else:
-                df_result = df_financials.query('cik == @c')[['cik', 'entityName', 'ccp', 'val', 'tag', 'label', 'end']].sort_values(by=['ccp'])
+                df_result = df_financials.iloc[cik_rows.get(c, [])][['cik', 'entityName', 'ccp', 'val', 'tag', 'label', 'end']].sort_values(by=['ccp'])
                 with open(RESULT_FILE, "a") as f:
                     f.write(f"\n\n{ticker} - {c}")
                     f.write(df_result.to_string())
@@ -87,7 +89,9 @@ logging.info("****************************************************************")
 #sic = edgar.get_sic("KVUE")
 #print(sic)
 
-edgar.create_training_database()
+#Guard needed by the worker processes of the archive mode (edgar.create_training_database(archive_path=config.COMPANYFACTS_ARCHIVE))
+if __name__ == "__main__":
+    edgar.create_training_database()
 
 #df2 = edgar.get_financial_concept_from_json(["Dummy"], json_data)
 #df2 = edgar.get_financial_concept_from_json(config.interestIncome, json_data)
@@ -0,0 +1,97 @@
+#This library contains the HTTP client shared by all the modules that connect to external websites.
+#All the requests go through one session, so connections are pooled per host and kept alive between
+#requests, and every request has a timeout and is retried with exponential backoff on transient errors.
+
+import email.utils
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+import configuration as config
+import instrumentation
+
+_session = None
+_lock = threading.Lock()
+
+
+def _get_session():
+	"""Returns the shared session, creating it the first time"""
+	global _session
+	with _lock:
+		if _session is None:
+			session = requests.Session()
+			#One pool per host with as many connections as workers, so connections are reused instead of opened per request
+			adapter = HTTPAdapter(pool_connections=config.HTTP_POOL_HOSTS, pool_maxsize=config.HTTP_POOL_MAXSIZE)
+			session.mount("https://", adapter)
+			session.mount("http://", adapter)
+			session.headers.update({"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
+			_session = session
+		return _session
+
+
+def _retry_after(response):
+	"""Returns the seconds to wait requested by the Retry-After header of the response or None if it is not present"""
+	value = response.headers.get("Retry-After")
+	if not value:
+		return None
+	if value.strip().isdigit():
+		return float(value)
+	try:
+		return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+	except Exception:
+		return None
+
+
+def _record_response(url, response, seconds, stream):
+	"""Records the latency and the bytes received of a response in the instrumentation of the run.
+	Bytes are taken from the Content-Length header (bytes transferred, compressed if the body is compressed) or from the body
+	if the header is not present and the body has already been read. Streamed bodies are added by the caller (record_streamed_bytes)"""
+	size = response.headers.get("Content-Length")
+	if size is not None and size.isdigit():
+		size = int(size)
+	else:
+		size = 0 if stream else len(response.content)
+	instrumentation.record_request(urlsplit(url).netloc, seconds, size, response.status_code)
+
+
+def record_streamed_bytes(url, response, size):
+	"""Records the bytes of a streamed body read by the caller when the response has no Content-Length, so they were not known
+	when the response was recorded"""
+	length = response.headers.get("Content-Length")
+	if length is None or not length.isdigit():
+		instrumentation.add_bytes(urlsplit(url).netloc, size)
+
+
+def get(url, headers=None, limiter=None, stream=False, timeout=None):
+	"""Sends a GET request through the shared session.
+	limiter is the rate limiter of the site (ratelimit module), a token is taken before every attempt.
+	Connection errors and the status codes in config.HTTP_RETRY_STATUS are retried up to config.HTTP_MAX_RETRIES times, waiting
+	with exponential backoff or the time requested by the Retry-After header.
+	Returns the response of the last attempt. Raises the connection error if the last attempt cannot connect"""
+	session = _get_session()
+	timeout = timeout or (config.HTTP_CONNECT_TIMEOUT, config.HTTP_READ_TIMEOUT)
+	attempt = 0
+	while True:
+		if limiter is not None:
+			limiter.acquire()
+		start = time.perf_counter()
+		try:
+			response = session.get(url, headers=headers, stream=stream, timeout=timeout)
+		except (requests.ConnectionError, requests.Timeout) as err:
+			instrumentation.record_request(urlsplit(url).netloc, time.perf_counter() - start, 0, type(err).__name__)
+			if attempt >= config.HTTP_MAX_RETRIES:
+				raise
+			wait = config.HTTP_BACKOFF_FACTOR * (2 ** attempt)
+			logging.warning("webclient.get: Request to %s failed, retrying in %.1f s - %s", url, wait, err)
+		else:
+			_record_response(url, response, time.perf_counter() - start, stream)
+			if response.status_code not in config.HTTP_RETRY_STATUS or attempt >= config.HTTP_MAX_RETRIES:
+				return response
+			retry_after = _retry_after(response)
+			wait = min(config.HTTP_MAX_RETRY_WAIT, retry_after if retry_after is not None else config.HTTP_BACKOFF_FACTOR * (2 ** attempt))
+			logging.warning("webclient.get: Request to %s answered %s, retrying in %.1f s", url, response.status_code, wait)
+			response.close()
+		attempt += 1
+		time.sleep(wait)
@@ -3,79 +3,93 @@
 
 import logging
 #import os
-from requests import get
 #from datetime import datetime
-from bs4 import BeautifulSoup
 import configuration as config
+import cache
+import ratelimit
+import webclient
+import htmlextract
+import instrumentation
 
 
 def check_connection(yTicker=""):
 	"""Checks if the connection to yahoo can be performed for the provided 
 	ticker"""
 	url = config.PROFILE_URL.format(yTicker)
-	logging.info(f"yahoo.check_connection: Trying connection to {url}")
+	logging.info("yahoo.check_connection: Trying connection to %s", url)
 	try:
-		r = get(url, headers=config.YAHOO_HEADERS)
+		r = webclient.get(url, headers=config.YAHOO_HEADERS, limiter=ratelimit.YAHOO)
 	except Exception as err:
-		logging.warning(f"yahoo.check_connection: Connection to {url} not possible - {err}")
+		logging.warning("yahoo.check_connection: Connection to %s not possible - %s", url, err)
 		return False
 	except:
-		logging.warning(f"yahoo.check_connection: Unexpected error.")
+		logging.warning("yahoo.check_connection: Unexpected error.")
 		return False
 	else:
 		if r.status_code != 200:
-			logging.warning(f"yahoo.check_connection: Connection to {url} not possible - {r.status_code}")
+			logging.warning("yahoo.check_connection: Connection to %s not possible - %s", url, r.status_code)
 			return False
 		else:
 			if config.ERROR_MESSAGE3 in r.text:
-				logging.warning(f"yahoo.check_connection: Ticker {yTicker} not found")
+				logging.warning("yahoo.check_connection: Ticker %s not found", yTicker)
 				return False
 			else:
-				logging.info(f"yahoo.check_connection: Connection to {url} working - {r.status_code}")
+				logging.info("yahoo.check_connection: Connection to %s working - %s", url, r.status_code)
 				return True
 
 
+@instrumentation.timed("yahoo.get_company_profile")
+def get_company_profile(yTicker="", offline=False):
+	"""Obtains the company sector and industry for the provided ticker scraping from Yahoo website.
+	The profile page is downloaded and its fields extracted (htmlextract module) only once and the result is stored in the profile cache, so known
+	tickers are not requested again until the cache entry expires. Pages where no field is found are not cached. In offline mode only the cache is used (expired entries included).
+	Returns a dictionary with keys sector and industry ("N/A" for the fields that cannot be obtained)"""
+	profile = cache.get(config.YAHOO_PROFILE_CACHE_FILE, yTicker, float("inf") if offline else config.YAHOO_PROFILE_CACHE_TTL)
+	if profile is not None:
+		return profile
+	profile = {"sector": "N/A", "industry": "N/A"}
+	if offline:
+		return profile
+	url = config.PROFILE_URL.format(yTicker)
+	logging.info("yahoo.get_company_profile: Getting profile from %s", url)
+	try:
+		r = webclient.get(url, headers=config.YAHOO_HEADERS, limiter=ratelimit.YAHOO)
+	except Exception as err:
+		logging.warning("yahoo.get_company_profile: Connection to %s not possible - %s", url, err)
+		return profile
+	if r.status_code != 200:
+		logging.warning("yahoo.get_company_profile: Connection to %s not possible - %s", url, r.status_code)
+		return profile
+	if config.ERROR_MESSAGE3 in r.text:
+		logging.warning("yahoo.get_company_profile: Ticker %s not found", yTicker)
+		return profile
+	fields = htmlextract.yahoo_profile(r.content.decode("utf-8", errors="replace"))
+	if fields["sector"] is None:
+		logging.warning("yahoo.get_company_profile: Sector not found for ticker %s", yTicker)
+	else:
+		profile["sector"] = fields["sector"]
+	if fields["industry"] is None:
+		logging.warning("yahoo.get_company_profile: Industry not found for ticker %s", yTicker)
+	else:
+		profile["industry"] = fields["industry"]
+	logging.info("yahoo.get_company_profile: Profile for ticker %s: %s", yTicker, profile)
+	#A page without any field (consent page, new layout) is not cached, so the ticker is requested again in the next build
+	if fields["sector"] is not None or fields["industry"] is not None:
+		cache.put(config.YAHOO_PROFILE_CACHE_FILE, yTicker, profile, config.YAHOO_PROFILE_CACHE_MAX_ENTRIES)
+	return profile
+
+
 def get_company_sector(yTicker=""):
 	"""Obtains the company sector for the provided ticker scraping from Yahoo website"""
-	logging.info(f"yahoo.get_company_sector: Getting sector for ticker {yTicker}")
-	if not check_connection(yTicker):
-		logging.warning(f"yahoo.get_company_sector: Connection to Yahoo not possible")
-		return "N/A"
-	else:
-		url = config.PROFILE_URL.format(yTicker)
-		r = get(url, headers=config.YAHOO_HEADERS)
-		soup = BeautifulSoup(r.content, "html.parser")
-		try:
-			sector = str(soup.find_all("dt")[0].find_next_sibling()).split('>')[2].split('<')[0].rstrip()
-		except AttributeError as err:
-			logging.warning(f"yahoo.get_company_sector: Sector not found for ticker {yTicker} - {err}")
-			return "N/A"
-		except Exception as err:
-			logging.warning(f"yahoo.get_company_sector: Sector not found for ticker {yTicker} - {err}")
-			return "N/A"
-		else:
-			logging.info(f"yahoo.get_company_sector: Sector for ticker {yTicker}: {sector}")
-			return sector
+	logging.info("yahoo.get_company_sector: Getting sector for ticker %s", yTicker)
+	sector = get_company_profile(yTicker)["sector"]
+	logging.info("yahoo.get_company_sector: Sector for ticker %s: %s", yTicker, sector)
+	return sector
 
 
 def get_company_industry(yTicker=""):
 	"""Obtains the company industry for the provided ticker scraping from Yahoo website"""
-	logging.info(f"yahoo.get_company_industry: Getting sector for ticker {yTicker}")
-	if not check_connection(yTicker):
-		logging.warning(f"yahoo.get_company_industry: Connection to Yahoo not possible")
-		return "N/A"
-	else:
-		url = config.PROFILE_URL.format(yTicker)
-		r = get(url, headers=config.YAHOO_HEADERS)
-		soup = BeautifulSoup(r.content, "html.parser")
-		try:
-			industry = str(soup.find_all("dt")[1].find_next_sibling()).split('>')[1].split('<')[0].rstrip().replace("amp;", "")
-		except AttributeError as err:
-			logging.warning(f"yahoo.get_company_industry: Industry not found for ticker {yTicker} - {err}")
-			return "N/A"
-		except Exception as err:
-			logging.warning(f"yahoo.get_company_industry: Industry not found for ticker {yTicker} - {err}")
-			return "N/A"
-		else:
-			logging.info(f"yahoo.get_company_industry: Industry for ticker {yTicker}: {industry}")
-			return industry
\ No newline at end of file
+	logging.info("yahoo.get_company_industry: Getting industry for ticker %s", yTicker)
+	industry = get_company_profile(yTicker)["industry"]
+	logging.info("yahoo.get_company_industry: Industry for ticker %s: %s", yTicker, industry)
+	return industry